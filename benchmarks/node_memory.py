@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+"""measures the memory held by parse tree nodes, in bytes per node.
+
+sizes are shallow: the node instance plus its __dict__, if any.  the
+strings a node refers to are left out since they are the same whatever
+the layout of the nodes.
+
+usage: python benchmarks/node_memory.py [repeat]
+
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlshade.lexer import Lexer
+
+TEMPLATE = """SELECT * FROM t_member /* comment */
+WHERE TRUE -- line comment
+  /*#if use_status*/AND status IN /*:status*/(1, 2)/*#/if*/
+  /*#for item in items*/OR (id = /*:item.id*/1 AND name = /*:item.name*/'x')/*#/for*/
+  /*#embed condition*/AND TRUE/*#/embed*/
+  /*#tip*/ORDER BY id/*#/tip*/
+"""
+
+def node_size(node):
+    size = sys.getsizeof(node)
+    attributes = getattr(node, '__dict__', None)
+    if attributes is not None:
+        size += sys.getsizeof(attributes)
+    return size
+
+def walk(node):
+    for n in node.get_children():
+        yield n
+        for child in walk(n):
+            yield child
+
+def measure(repeat=100):
+    root = Lexer(TEMPLATE * repeat).parse()
+    stats = {}
+    for n in walk(root):
+        (count, size) = stats.get(n.__class__.__name__, (0, 0))
+        stats[n.__class__.__name__] = (count + 1, size + node_size(n))
+    return stats
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    stats = measure(repeat)
+    (total_count, total_size) = (0, 0)
+    print "%-20s %8s %14s" % ('node', 'count', 'bytes/node')
+    for name in sorted(stats):
+        (count, size) = stats[name]
+        total_count += count
+        total_size += size
+        print "%-20s %8d %14.1f" % (name, count, float(size) / count)
+    print "%-20s %8d %14.1f" % ('all', total_count, float(total_size) / total_count)
+
+if __name__ == '__main__':
+    main()
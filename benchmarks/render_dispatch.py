@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+"""measures the time sqlgen spends per node walking a parse tree.
+
+compares the walk over precomputed dispatch tables with the former walk,
+which let each node look up its visit method by name through
+Node.accept_visitor.
+
+usage: python benchmarks/render_dispatch.py [repeat]
+
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlshade import sqlgen, util
+from sqlshade.lexer import Lexer
+
+TEMPLATE = """SELECT * FROM t_member /* comment */
+WHERE TRUE -- line comment
+  /*#if use_status*/AND status IN /*:status*/(1, 2)/*#/if*/
+  /*#for item in items*/OR (id = /*:item.id*/1 AND name = /*:item.name*/'x')/*#/for*/
+  /*#tip*/ORDER BY id/*#/tip*/
+"""
+
+DATA = dict(use_status=True, status=[1, 2, 3],
+            items=[dict(id=i, name='name%d' % i) for i in range(5)])
+
+class AcceptVisitorListStatement(sqlgen.RenderListStatement):
+    """walks the tree the way sqlgen did before dispatch tables."""
+
+    def walk(self, nodes, context):
+        for n in nodes:
+            n.accept_visitor(self, context)
+
+def count_visits(node, data):
+    counter = [0]
+    class CountingListStatement(sqlgen.RenderListStatement):
+        def walk(self, nodes, context):
+            counter[0] += len(nodes)
+            super(CountingListStatement, self).walk(nodes, context)
+    printer = sqlgen.ListStatementPrinter(util.FastEncodingBuffer())
+    CountingListStatement(printer, sqlgen.RenderContext(dict(data), strict=True), node)
+    return counter[0]
+
+def render(statement, node, data):
+    printer = sqlgen.ListStatementPrinter(util.FastEncodingBuffer())
+    statement(printer, sqlgen.RenderContext(dict(data), strict=True), node)
+    return printer.freeze()
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    node = Lexer(TEMPLATE * 10).parse()
+    visits = count_visits(node, DATA)
+    assert render(AcceptVisitorListStatement, node, DATA) == \
+        render(sqlgen.RenderListStatement, node, DATA)
+    print "%d node visits per render, %d renders" % (visits, repeat)
+    for (name, statement) in [('accept_visitor', AcceptVisitorListStatement),
+                              ('dispatch table', sqlgen.RenderListStatement)]:
+        elapsed = min(timeit.repeat(lambda: render(statement, node, DATA), number=repeat, repeat=3))
+        print "%-16s %8.3f us/render %8.3f us/node" % (
+            name, elapsed / repeat * 1e6, elapsed / repeat / visits * 1e6)
+
+if __name__ == '__main__':
+    main()
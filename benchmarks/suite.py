@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+"""runs the benchmark suite, printing its results as JSON.
+
+every case runs in a process of its own, so that its memory figures are
+its own.  each reports:
+
+  ops_per_sec          operations per second, the best of several timed runs
+  normalized           ops_per_sec over that of a pure python calibration
+                       workload, the best timed in the same process just
+                       before and after
+  max_rss_kb           the peak resident memory of the process running the case
+  rss_growth_kb        how much that peak grew while the case ran
+  retained_gc_objects  the objects tracked by the garbage collector that one
+                       operation leaves behind: not its allocations, which
+                       python 2 keeps no count of, but what it leaks or caches
+
+with a baseline, the results of an earlier run, the change of the
+normalized figure of every case is reported too, so that runs on
+machines of different speeds compare.  cases slower than the threshold
+allows, 10% or 50% with --quick, are reported on stderr, and fail the
+run when the baseline was given with --baseline.
+
+usage: python benchmarks/suite.py [--quick] [--output FILE]
+                                  [--baseline FILE] [--threshold PERCENT] [case ...]
+
+"""
+
+import gc
+import json
+import optparse
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sqlshade
+from sqlshade.lexer import Lexer
+from sqlshade.template import Template
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+TEMPLATE = """SELECT * FROM t_member /* comment */
+WHERE TRUE -- line comment
+  /*#if use_status*/AND status IN /*:status*/(1, 2)/*#/if*/
+  /*#for item in items*/OR (id = /*:item.id*/1 AND name = /*:item.name*/'x')/*#/for*/
+  /*#embed condition*/AND TRUE/*#/embed*/
+  /*#tip*/ORDER BY id/*#/tip*/
+"""
+
+def lex(repeat):
+    text = TEMPLATE * repeat
+    return lambda: Lexer(text).parse()
+
+def lex_large():
+    # about 2MB of template text
+    return lex(2 * 1024 * 1024 // len(TEMPLATE) + 1)
+
+def render_scalar():
+    template = Template("""SELECT * FROM t_member WHERE id = /*:id*/1 AND name = /*:name*/'a'
+        AND status = /*:status*/1 AND kind = /*:kind*/'k' AND created > /*:created*/'2010-01-01'""")
+    context = dict(id=1, name='kjim', status=2, kind='admin', created='2011-01-01')
+    return lambda: template.render(**context)
+
+def render_in_list(length, parameter_format='list'):
+    template = Template("SELECT * FROM t_member WHERE id IN /*:ids*/(1, 2)",
+                        parameter_format=parameter_format)
+    ids = range(length)
+    return lambda: template.render(ids=ids)
+
+def render_nested_loops(parameter_format='list'):
+    template = Template("""SELECT * FROM t_member WHERE FALSE
+        /*#for group in groups*//*#for member in group.members*//*#if member.active*/
+        OR (group_id = /*:group.id*/1 AND id = /*:member.id*/1)
+        /*#/if*//*#/for*//*#/for*/""", parameter_format=parameter_format)
+    groups = [dict(id=g, members=[dict(id=m, active=m % 3 != 0) for m in range(10)])
+              for g in range(10)]
+    return lambda: template.render(groups=groups)
+
+def render_nested_embed():
+    status = Template("status IN /*:statuses*/(1)")
+    condition = Template("name = /*:name*/'a' AND /*#embed status*/TRUE/*#/embed*/")
+    where = Template("id = /*:id*/1 AND /*#embed condition*/TRUE/*#/embed*/")
+    template = Template("SELECT * FROM t_member WHERE /*#embed where*/TRUE/*#/embed*/")
+    context = dict(id=1, name='kjim', statuses=[1, 2, 3],
+                   status=status, condition=condition, where=where)
+    return lambda: template.render(**context)
+
+def calibration():
+    words = [str(n) for n in range(1000)]
+    return lambda: ' '.join(sorted(words, reverse=True)).split()
+
+CASES = [
+    ('lex_small', lambda: lex(1)),
+    ('lex_medium', lambda: lex(100)),
+    ('lex_large', lex_large),
+    ('render_scalar', render_scalar),
+    ('render_in_list_1000', lambda: render_in_list(1000)),
+    ('render_in_list_1000_dict', lambda: render_in_list(1000, 'dict')),
+    ('render_nested_loops', render_nested_loops),
+    ('render_nested_loops_dict', lambda: render_nested_loops('dict')),
+    ('render_nested_embed', render_nested_embed),
+]
+
+def max_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # bytes there, kilobytes elsewhere
+        rss //= 1024
+    return rss
+
+def time_op(op, min_time, repeat):
+    """return the best ops/sec of op over repeat runs of at least min_time seconds."""
+    number = 1
+    while True:
+        elapsed = timeit.timeit(op, number=number)
+        if elapsed >= min_time:
+            break
+        number *= max(2, min(10, int(min_time / max(elapsed, 1e-9))))
+    elapsed = min([elapsed] + timeit.repeat(op, number=number, repeat=repeat - 1))
+    return number / elapsed
+
+def retained_gc_objects(op):
+    """return the number of objects tracked by the garbage collector that
+    one run of op leaves behind."""
+    gc.collect()
+    before = len(gc.get_objects())
+    op()
+    gc.collect()
+    return len(gc.get_objects()) - before
+
+def run_case(name, min_time, repeat):
+    calibrate = calibration()
+    calibration_ops_per_sec = time_op(calibrate, min_time, repeat)
+    op = dict(CASES)[name]()
+    op()
+    rss_before = max_rss_kb()
+    ops_per_sec = time_op(op, min_time, repeat)
+    calibration_ops_per_sec = max(calibration_ops_per_sec, time_op(calibrate, min_time, repeat))
+    retained = retained_gc_objects(op)
+    rss = max_rss_kb()
+    return {
+        'ops_per_sec': round(ops_per_sec, 2),
+        'normalized': round(ops_per_sec / calibration_ops_per_sec, 6),
+        'max_rss_kb': rss,
+        'rss_growth_kb': rss - rss_before,
+        'retained_gc_objects': retained,
+    }
+
+def run_child(name, options):
+    args = [sys.executable, os.path.abspath(__file__), '--child', name,
+            '--min-time', str(options.min_time), '--repeat', str(options.repeat)]
+    output = subprocess.Popen(args, stdout=subprocess.PIPE).communicate()[0]
+    return json.loads(output)
+
+def compare(results, baseline, threshold):
+    """return the change of every case against the baseline, in percent of
+    its normalized ops/sec, flagging those slower than the threshold allows."""
+    comparison = {}
+    for name, result in results.items():
+        base = baseline.get('cases', {}).get(name)
+        if not base or not base.get('normalized'):
+            continue
+        change = (result['normalized'] / base['normalized'] - 1) * 100
+        comparison[name] = {
+            'baseline_normalized': base['normalized'],
+            'change_percent': round(change, 1),
+            'regression': change < -threshold,
+        }
+    return comparison
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] [case ...]")
+    parser.add_option('--quick', action='store_true', default=False,
+                      help="time shorter runs, for a rough figure")
+    parser.add_option('--output', help="write the results to FILE as well")
+    parser.add_option('--baseline',
+                      help="compare with the results in FILE, failing on a regression "
+                           "[default: only warn against benchmarks/baseline.json]")
+    parser.add_option('--threshold', type='float', default=None,
+                      help="slowdown in percent counted as a regression "
+                           "[default: 10, or 50 with --quick]")
+    parser.add_option('--min-time', type='float', default=None, help=optparse.SUPPRESS_HELP)
+    parser.add_option('--repeat', type='int', default=None, help=optparse.SUPPRESS_HELP)
+    parser.add_option('--child', help=optparse.SUPPRESS_HELP)
+    (options, names) = parser.parse_args()
+    if options.min_time is None:
+        options.min_time = 0.05 if options.quick else 0.2
+    if options.repeat is None:
+        options.repeat = 2 if options.quick else 5
+    if options.threshold is None:
+        # the shorter runs of --quick vary a lot more
+        options.threshold = 50.0 if options.quick else 10.0
+
+    if options.child:
+        json.dump(run_case(options.child, options.min_time, options.repeat), sys.stdout)
+        return 0
+
+    known = [name for (name, setup) in CASES]
+    for name in names:
+        if name not in known:
+            parser.error("unknown case '%s', choose from: %s" % (name, ', '.join(known)))
+    results = {}
+    for name in names or known:
+        results[name] = run_child(name, options)
+    report = {
+        'sqlshade': sqlshade.__version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'cases': results,
+    }
+    regressions = []
+    baseline_path = options.baseline or BASELINE
+    if os.path.isfile(baseline_path):
+        f = open(baseline_path)
+        try:
+            baseline = json.load(f)
+        finally:
+            f.close()
+        report['comparison'] = compare(results, baseline, options.threshold)
+        regressions = [name for (name, c) in report['comparison'].items() if c['regression']]
+    text = json.dumps(report, indent=2, sort_keys=True)
+    print text
+    if options.output:
+        f = open(options.output, 'w')
+        try:
+            f.write(text + '\n')
+        finally:
+            f.close()
+    if regressions:
+        sys.stderr.write("slower than the baseline: %s\n" % ', '.join(sorted(regressions)))
+        if options.baseline:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
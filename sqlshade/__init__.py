@@ -1 +1,3 @@
 #
+
+__version__ = '0.2.2'
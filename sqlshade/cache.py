@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""provides the CompileCache class for keeping parse trees on disk."""
+
+import os
+import hashlib
+import tempfile
+import cPickle as pickle
+
+import sqlshade
+
+# the format of the pickled trees: bump whenever the node classes change
+TREE_FORMAT = 1
+
+class CompileCache(object):
+    """a persistent cache of compiled parse trees, stored as pickles under a
+    directory.
+
+    entries are keyed by a hash of the template source, its filename, the
+    compile options, the sqlshade version and TREE_FORMAT, so an upgrade or
+    an edited source never reuses a stale tree.  entries are written to a
+    temporary file and renamed into place, and an entry that cannot be read
+    back is removed and treated as missing.
+
+    the cache is best-effort: a directory that cannot be created or written
+    to only leaves the trees uncached.
+
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        try:
+            os.makedirs(directory)
+        except OSError:
+            pass
+
+    def key(self, text, filename=None, **options):
+        """return the key of the tree compiled from the given source and options."""
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        digest = hashlib.sha1()
+        digest.update(repr((sqlshade.__version__, TREE_FORMAT, filename,
+                            sorted(options.items()))))
+        digest.update('\0')
+        digest.update(text)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def get(self, key):
+        """return the tree stored under the given key, or None."""
+        path = self.path(key)
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            return None
+        try:
+            try:
+                (version, format, stored_key, node) = pickle.load(f)
+            finally:
+                f.close()
+        except Exception:
+            self._discard(path)
+            return None
+        if (version, format, stored_key) != (sqlshade.__version__, TREE_FORMAT, key):
+            self._discard(path)
+            return None
+        return node
+
+    def put(self, key, node):
+        """store the given tree under the given key, unless the directory
+        cannot be written to."""
+        try:
+            (fd, tmppath) = tempfile.mkstemp(prefix='.' + key, dir=self.directory)
+        except (OSError, IOError):
+            return
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                pickle.dump((sqlshade.__version__, TREE_FORMAT, key, node), f,
+                            pickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+            if os.name == 'nt' and os.path.exists(self.path(key)):
+                os.remove(self.path(key))
+            os.rename(tmppath, self.path(key))
+        except (OSError, IOError):
+            self._discard(tmppath)
+        except:
+            self._discard(tmppath)
+            raise
+
+    def _discard(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
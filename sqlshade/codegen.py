@@ -0,0 +1,927 @@
+# -*- coding: utf-8 -*-
+
+"""generates python render functions from sqlshade parse trees.
+
+where sqlgen walks the parse tree on every render, this module turns a tree
+into the source of python functions per parameter format and mode, with
+literals, binds, ifs and for-loops written out as straight-line code.
+
+the query a template renders to depends only on its shape: which ifs are
+taken, how many times each for-loop runs and how long each bound list is.
+so a render first only gathers the bound variables along with a signature
+of that shape, and the query is built only for shapes not seen before.
+
+"""
+
+import weakref
+
+from sqlshade import tree, exc
+from sqlshade.scope import Scope
+from sqlshade.sqlgen import ITERABLE_DATA_TYPES, get_list_padding, pad_list, list_placeholders, \
+     get_array_binding, escape_percent
+
+# the number of queries kept per render function, one per shape
+SHAPE_CACHE_SIZE = 100
+
+# the longest shape signature and query kept in the shape cache: larger
+# renders, such as loops over thousands of rows, are built without it
+SHAPE_MAX_SIGNATURE = 1000
+SHAPE_MAX_SQL_LENGTH = 16384
+
+# the number of query fragments collected by a streaming render function
+# before it yields them
+STREAM_CHUNK_SIZE = 1000
+
+class Unshaped(Exception):
+    """raised when gathering the shape signature would consume an iterator."""
+
+class SourceWriter(object):
+    """accumulates indented lines of python source."""
+
+    def __init__(self):
+        self.lines = []
+        self.indent = 0
+
+    def writeline(self, line):
+        self.lines.append('    ' * self.indent + line)
+
+    def push(self):
+        self.indent += 1
+
+    def pop(self):
+        self.indent -= 1
+
+    def getvalue(self):
+        return '\n'.join(self.lines) + '\n'
+
+class RenderFunctionGenerator(object):
+    """abstract base class for render function generators.
+
+    subclasses define how bound variables are written for a parameter format.
+
+    """
+
+    # whether the '%' of the query text is escaped, as for the format paramstyles
+    escape_percent = False
+
+    # the extra parameters of the generated functions, and the arguments passing them on
+    extra_params = ''
+    extra_args = ''
+
+    # the extra parameters of the functions rendering into the query of a
+    # parent template, and the arguments passing them on
+    into_params = ''
+    into_args = ''
+
+    def __init__(self, node, strict=True, list_padding=None, array_binds=None, stream=False):
+        self.node = node
+        self.strict = strict
+        self.stream = stream
+        self.list_padding = list_padding
+        self.array_binding = get_array_binding(array_binds)
+        self.writer = SourceWriter()
+        self.pending = []
+        self.loops = []
+        self.depth = 0
+        self.namespace = {}
+        self.gathering = False
+        self.streaming = False
+
+    def generate(self):
+        if self.stream:
+            self.write_stream_function()
+            return self.writer.getvalue()
+        self.write_function('_render', False)
+        self.write_function('_gather', True)
+        self.write_into_function('_render_into', False)
+        self.write_into_function('_gather_into', True)
+        self.write_shaped_render()
+        binds = self.constant_shape_binds()
+        if binds is None:
+            self.writer.writeline('render = _shaped')
+        else:
+            self.write_constant_shape_render(binds)
+        return self.writer.getvalue()
+
+    def write_function(self, name, gathering):
+        """write the function building the query, or with gathering, the
+        function returning the shape signature in place of the query."""
+        w = self.writer
+        self.gathering = gathering
+        w.writeline('def %s(data%s):' % (name, self.extra_params))
+        w.push()
+        if gathering:
+            w.writeline('_sig = []')
+            w.writeline('_g = _sig.append')
+        else:
+            w.writeline('_buf = []')
+            w.writeline('_w = _buf.append')
+        self.write_prologue()
+        self.visit_children(self.node)
+        self.flush()
+        if gathering:
+            w.writeline('return tuple(_sig), _params')
+        else:
+            w.writeline("return ''.join(_buf), _params")
+        w.pop()
+        self.gathering = False
+
+    def write_into_function(self, name, gathering):
+        """write the function rendering the template as embedded in another,
+        writing into the query, or with gathering the signature, and the
+        bound variables of the parent."""
+        w = self.writer
+        self.gathering = gathering
+        w.writeline('def %s(data, %s, _params%s):' % (name, gathering and '_g' or '_w', self.into_params))
+        w.push()
+        start = len(w.lines)
+        self.write_into_prologue()
+        self.visit_children(self.node)
+        self.flush()
+        if len(w.lines) == start:
+            w.writeline('pass')
+        w.pop()
+        self.gathering = False
+
+    def write_into_prologue(self):
+        pass
+
+    def write_stream_function(self):
+        """write a generator function yielding the query in chunks, each with
+        the bound variables of its own."""
+        w = self.writer
+        self.streaming = True
+        w.writeline('def render(data, _chunk_size=%d%s):' % (STREAM_CHUNK_SIZE, self.extra_params))
+        w.push()
+        w.writeline('_buf = []')
+        w.writeline('_w = _buf.append')
+        self.write_prologue()
+        self.visit_children(self.node)
+        self.flush()
+        w.writeline('if _buf:')
+        w.push()
+        w.writeline("yield ''.join(_buf), _params")
+        w.pop()
+        w.pop()
+        self.streaming = False
+
+    def write_chunk(self):
+        """yield the query and bound variables collected so far, once there
+        are enough of them."""
+        w = self.writer
+        self.flush()
+        w.writeline('if len(_buf) >= _chunk_size:')
+        w.push()
+        w.writeline("yield ''.join(_buf), _params")
+        self.write_chunk_advance()
+        w.writeline('_buf = []')
+        w.writeline('_w = _buf.append')
+        self.write_prologue()
+        w.pop()
+
+    def write_shaped_render(self):
+        """write the render function looking up the query by shape signature.
+
+        a for-loop over an iterator cannot be run twice, so the query is
+        then built without looking for it, as it is for a loop, signature or
+        query too large to be worth keeping.
+
+        """
+        w = self.writer
+        w.writeline('def _shaped(data%s):' % self.extra_params)
+        w.push()
+        w.writeline('try:')
+        w.push()
+        w.writeline('_sig, _params = _gather(data%s)' % self.extra_args)
+        w.pop()
+        w.writeline('except _Unshaped:')
+        w.push()
+        w.writeline('return _render(data%s)' % self.extra_args)
+        w.pop()
+        w.writeline('if len(_sig) > _shape_max_signature:')
+        w.push()
+        w.writeline('return _render(data%s)' % self.extra_args)
+        w.pop()
+        self.write_shape_key()
+        w.writeline('try:')
+        w.push()
+        w.writeline('return _shapes[_sig], _params')
+        w.pop()
+        w.writeline('except KeyError:')
+        w.push()
+        w.writeline('pass')
+        w.pop()
+        w.writeline('_sql, _params = _render(data%s)' % self.extra_args)
+        w.writeline('if len(_sql) > _shape_max_sql_length:')
+        w.push()
+        w.writeline('return _sql, _params')
+        w.pop()
+        w.writeline('if len(_shapes) >= _shape_cache_size:')
+        w.push()
+        w.writeline('try:')
+        w.push()
+        w.writeline('_shapes.popitem()')
+        w.pop()
+        w.writeline('except KeyError:')
+        w.push()
+        w.writeline('pass')
+        w.pop()
+        w.pop()
+        w.writeline('_shapes[_sig] = _sql')
+        w.writeline('return _sql, _params')
+        w.pop()
+
+    def constant_shape_binds(self):
+        """return the substitute comments of the template if its query never
+        changes shape, that is, it has no controls besides tips; else None."""
+        binds = []
+        for n in self.node.get_children():
+            if isinstance(n, tree.SubstituteComment):
+                if '' in n.ident.split('.'):
+                    return None
+                binds.append(n)
+            elif not isinstance(n, (tree.Literal, tree.Comment, tree.Tip)):
+                return None
+        return binds
+
+    def write_constant_shape_render(self, binds):
+        """write a render function that returns the query built once at
+        compile time and only collects the bound variables.
+
+        the shaped function is called instead when a variable is missing
+        or is a list, since the query then differs from the one built here.
+
+        """
+        fragments = []
+        for n in self.node.get_children():
+            if isinstance(n, tree.Literal):
+                fragments.append(self.escape(n.text))
+            elif isinstance(n, tree.SubstituteComment):
+                fragments.append(self.constant_placeholder(n))
+        variables = []
+        n_by_ident = {}
+        for n in binds:
+            if n.ident not in variables:
+                variables.append(n.ident)
+                n_by_ident[n.ident] = n
+        names = ['_v%d' % (i + 1) for i in range(len(variables))]
+
+        w = self.writer
+        w.writeline('_sql = %r' % ''.join(fragments))
+        w.writeline('def render(data%s):' % self.extra_params)
+        w.push()
+        self.write_constant_shape_prologue()
+        if variables:
+            w.writeline('try:')
+            w.push()
+            for name, ident in zip(names, variables):
+                w.writeline('%s = %s' % (name, self.resolve_expr(n_by_ident[ident])))
+            w.pop()
+            w.writeline('except KeyError:')
+            w.push()
+            w.writeline('return _shaped(data%s)' % self.extra_args)
+            w.pop()
+            w.writeline('if %s:' % ' or '.join(['isinstance(%s, _iterable)' % name for name in names]))
+            w.push()
+            w.writeline('return _shaped(data%s)' % self.extra_args)
+            w.pop()
+        w.writeline('return _sql, %s' % self.constant_params_expr(
+            [(n, names[variables.index(n.ident)]) for n in binds]))
+        w.pop()
+
+    def write_prologue(self):
+        raise NotImplementedError()
+
+    def write_bind(self, node):
+        raise NotImplementedError()
+
+    def constant_placeholder(self, node):
+        raise NotImplementedError()
+
+    def constant_params_expr(self, binds):
+        raise NotImplementedError()
+
+    def write_shape_key(self):
+        """turn _sig into the key of the query in the shape cache."""
+        pass
+
+    def embed_args(self):
+        """return the extra arguments passed on to an embedded template."""
+        return self.into_args
+
+    def write_constant_shape_prologue(self):
+        pass
+
+    def write_chunk_advance(self):
+        pass
+
+    def escape(self, text):
+        if self.escape_percent:
+            return escape_percent(text)
+        return text
+
+    def write_padding(self):
+        if self.list_padding:
+            self.writer.writeline('_v = _pad_list(_v, _padded_length)')
+
+    def write_loop_counter_start(self, depth):
+        pass
+
+    def write_loop_counter_step(self, depth):
+        pass
+
+    def flush(self):
+        """write out the literal text collected since the last statement."""
+        text = ''.join(self.pending)
+        self.pending = []
+        if text and not self.gathering:
+            self.writer.writeline('_w(%r)' % text)
+
+    def write_output(self, expr):
+        """write out a piece of the query, which is part of the signature
+        when gathering."""
+        if self.gathering:
+            self.writer.writeline('_g(%s)' % expr)
+        else:
+            self.writer.writeline('_w(%s)' % expr)
+
+    def write_block(self, node):
+        self.writer.push()
+        start = len(self.writer.lines)
+        self.visit_children(node)
+        self.flush()
+        if len(self.writer.lines) == start:
+            self.writer.writeline('pass')
+        self.writer.pop()
+
+    def resolve_expr(self, node):
+        """return the expression looking up the variable of node in data.
+
+        the alias of an enclosing for-loop is read from the loop variable
+        directly.  a dotted identifier is looked up by the resolver of the
+        node, which is made available to the function under a name of its own.
+
+        """
+        if '.' not in node.ident:
+            for (alias, depth) in reversed(self.loops):
+                if alias == node.ident:
+                    return '_i%d' % depth
+            return 'data[%r]' % node.ident
+        name = '_r%d' % (len(self.namespace) + 1)
+        self.namespace[name] = node.resolver
+        return '%s(data)' % name
+
+    def write_resolve(self, node, target):
+        """assign the variable of node to target, returning True if a block
+        was opened that is only entered when the variable is feeded."""
+        w = self.writer
+        if '' in node.ident.split('.'):
+            if self.strict:
+                self.write_missing_variable(node.ident)
+            else:
+                w.writeline('if False:')
+                w.push()
+                return True
+            return False
+        w.writeline('try:')
+        w.push()
+        w.writeline('%s = %s' % (target, self.resolve_expr(node)))
+        w.pop()
+        w.writeline('except KeyError:')
+        w.push()
+        if self.strict:
+            self.write_missing_variable(node.ident)
+        elif self.gathering:
+            w.writeline('_g(None)')
+        else:
+            w.writeline('pass')
+        w.pop()
+        if self.strict:
+            return False
+        w.writeline('else:')
+        w.push()
+        return True
+
+    def write_missing_variable(self, ident):
+        self.writer.writeline('raise _RenderError(%r)' % ("No variable feeded: '%s'" % ident))
+
+    def visit_children(self, node):
+        for n in node.get_children():
+            getattr(self, 'visit' + n.__class__.__name__)(n)
+
+    def visitLiteral(self, node):
+        self.pending.append(self.escape(node.text))
+
+    def visitComment(self, node):
+        pass
+
+    def visitTip(self, node):
+        pass
+
+    def visitInclude(self, node):
+        # left in a tree not linked by a template: its stand-in text is kept,
+        # as in sqlgen
+        self.visit_children(node)
+
+    def visitSubstituteComment(self, node):
+        self.flush()
+        if '' in node.ident.split('.'):
+            if self.strict:
+                self.write_missing_variable(node.ident)
+            return
+        guarded = self.write_resolve(node, '_v')
+        self.write_bind(node)
+        if guarded:
+            self.writer.pop()
+
+    def visitIf(self, node):
+        self.flush()
+        w = self.writer
+        guarded = self.write_resolve(node, '_c')
+        w.writeline('if _c:')
+        if self.gathering:
+            w.push()
+            w.writeline('_g(1)')
+            w.pop()
+            self.write_block(node)
+            w.writeline('else:')
+            w.push()
+            w.writeline('_g(0)')
+            w.pop()
+        else:
+            self.write_block(node)
+        if guarded:
+            w.pop()
+
+    def visitFor(self, node):
+        self.flush()
+        w = self.writer
+        guarded = self.write_resolve(node, '_c')
+        self.depth += 1
+        depth = self.depth
+        if self.gathering:
+            w.writeline('if isinstance(_c, _sequence):')
+            w.push()
+            w.writeline('if len(_c) > _shape_max_signature:')
+            w.push()
+            w.writeline('raise _Unshaped()')
+            w.pop()
+            w.pop()
+            w.writeline('elif iter(_c) is _c:')
+            w.push()
+            w.writeline('raise _Unshaped()')
+            w.pop()
+        self.write_loop_counter_start(depth)
+        w.writeline('_d%d = data' % depth)
+        w.writeline('for _i%d in _c:' % depth)
+        w.push()
+        self.write_loop_counter_step(depth)
+        w.writeline('data = _Scope(_d%d, %r, _i%d)' % (depth, str(node.item), depth))
+        if self.gathering:
+            w.writeline('_g(1)')
+        w.pop()
+        self.loops.append((node.item, depth))
+        self.write_block(node)
+        if self.streaming:
+            w.push()
+            self.write_chunk()
+            w.pop()
+        self.loops.pop()
+        w.writeline('data = _d%d' % depth)
+        if self.gathering:
+            w.writeline('_g(0)')
+        self.depth -= 1
+        if guarded:
+            w.pop()
+
+    def visitEmbed(self, node):
+        self.flush()
+        w = self.writer
+        guarded = self.write_resolve(node, '_e')
+        w.writeline('if isinstance(_e, _Template):')
+        w.push()
+        w.writeline('_e = _e.node')
+        w.pop()
+        w.writeline('if isinstance(_e, _Node):')
+        w.push()
+        renderer = '_get_renderer(_e, %r, True, _list_padding, _array_binds)' % self.parameter_format
+        if self.gathering:
+            w.writeline('_g(_e)')
+            w.writeline('%s.gather_into(data, _g, _params%s)' % (renderer, self.embed_args()))
+        else:
+            w.writeline('%s.render_into(data, _w, _params%s)' % (renderer, self.embed_args()))
+        w.pop()
+        w.writeline('else:')
+        w.push()
+        if self.escape_percent:
+            self.write_output("_e.replace('%', '%%')")
+        else:
+            self.write_output('_e')
+        w.pop()
+        if guarded:
+            w.pop()
+
+class ListRenderGenerator(RenderFunctionGenerator):
+    """generates render functions binding variables as '?' with a list of parameters."""
+
+    parameter_format = 'list'
+    placeholder = '?'
+
+    def write_prologue(self):
+        self.writer.writeline('_params = []')
+        self.writer.writeline('_p = _params.append')
+
+    def write_bind(self, node):
+        w = self.writer
+        w.writeline('if isinstance(_v, _iterable):')
+        w.push()
+        if self.array_binding is not None:
+            if self.gathering:
+                w.writeline('_g(-1)')
+            else:
+                w.writeline('_w(%r)' % self.array_binding.write(self.placeholder))
+            w.writeline('_p(_array(_v))')
+        else:
+            self.write_padding()
+            if self.gathering:
+                w.writeline('_g(_gather_list(_v, _params))')
+            else:
+                w.writeline('_w(_expand_list(_v, _params, %r))' % self.placeholder)
+        w.pop()
+        w.writeline('else:')
+        w.push()
+        if self.gathering:
+            w.writeline('_g(0)')
+        else:
+            w.writeline('_w(%r)' % self.placeholder)
+        w.writeline('_p(_v)')
+        w.pop()
+
+    def write_into_prologue(self):
+        self.writer.writeline('_p = _params.append')
+
+    def constant_placeholder(self, node):
+        return self.placeholder
+
+    def constant_params_expr(self, binds):
+        return '[' + ', '.join([name for (n, name) in binds]) + ']'
+
+class DictRenderGenerator(RenderFunctionGenerator):
+    """generates render functions binding variables as ':name' with a dict of parameters."""
+
+    parameter_format = 'dict'
+
+    # the placeholder of a variable, formatted with its name
+    named_placeholder = ':%s'
+
+    def write_prologue(self):
+        self.writer.writeline('_params = {}')
+
+    def write_loop_counter_start(self, depth):
+        self.writer.writeline('_n%d = 0' % depth)
+
+    def write_loop_counter_step(self, depth):
+        self.writer.writeline('_n%d += 1' % depth)
+        self.writer.writeline('_s%d = str(_n%d)' % (depth, depth))
+
+    def loop_depth_of(self, node):
+        """return the depth of the innermost for-loop numbering the binds of node, if any."""
+        if self.loops:
+            (alias, depth) = self.loops[-1]
+            if node.ident == alias or node.ident.startswith(alias + '.'):
+                return depth
+        return None
+
+    def write_bind_key(self, node):
+        """write the name of the variable of node into _k, returning it
+        when it is known at compile time, else None."""
+        ident = node.ident.replace('.', '__dot__')
+        depth = self.loop_depth_of(node)
+        if depth is None:
+            self.writer.writeline('_k = %r' % ident)
+            return ident
+        else:
+            self.writer.writeline('_k = %r + _s%d' % (ident + '_', depth))
+            return None
+
+    def write_bind(self, node):
+        w = self.writer
+        ident = self.write_bind_key(node)
+        w.writeline('if isinstance(_v, _iterable):')
+        w.push()
+        if self.array_binding is not None:
+            if self.gathering:
+                w.writeline('_g(-1)')
+            elif ident is not None:
+                w.writeline('_w(%r)' % self.array_binding.write(self.named_placeholder % ident))
+            else:
+                w.writeline('_w(%r %% (%r %% _k))' % (self.array_binding.placeholder, self.named_placeholder))
+            w.writeline('_params[_k] = _array(_v)')
+        else:
+            self.write_padding()
+            if self.gathering:
+                w.writeline('_g(_gather_dict(_k, _v, _params))')
+            else:
+                w.writeline('_w(_expand_dict(_k, _v, _params, %r))' % self.named_placeholder)
+        w.pop()
+        w.writeline('else:')
+        w.push()
+        if self.gathering:
+            w.writeline('_g(0)')
+        elif ident is not None:
+            w.writeline('_w(%r)' % (self.named_placeholder % ident))
+        else:
+            w.writeline('_w(%r %% _k)' % self.named_placeholder)
+        w.writeline('_params[_k] = _v')
+        w.pop()
+
+    def constant_placeholder(self, node):
+        return self.named_placeholder % node.ident.replace('.', '__dot__')
+
+    def constant_params_expr(self, binds):
+        return '{' + ', '.join(['%r: %s' % (n.ident.replace('.', '__dot__'), name)
+                                for (n, name) in binds]) + '}'
+
+class FormatRenderGenerator(ListRenderGenerator):
+    """generates render functions binding variables as '%s' with a list of parameters."""
+
+    parameter_format = 'format'
+    placeholder = '%s'
+    escape_percent = True
+
+class PyformatRenderGenerator(DictRenderGenerator):
+    """generates render functions binding variables as '%(name)s' with a dict of parameters."""
+
+    parameter_format = 'pyformat'
+    named_placeholder = '%%(%s)s'
+    escape_percent = True
+
+class NumericRenderGenerator(DictRenderGenerator):
+    """generates render functions binding variables as '$1' with a list of
+    parameters, giving repeated names the same number.
+
+    the functions take the number of parameters bound before them, which
+    is how the chunks of a stream carry on the numbering of the previous
+    ones.  embedded templates share the numbers of their parent, unless
+    embedded in a for-loop.  the names of the items of for-loops are not
+    unique across the loops, so their variables get numbers of their own.
+
+    """
+
+    parameter_format = 'numeric'
+    extra_params = ', _base=0'
+    extra_args = ', _base'
+    into_params = ', _numbers, _base'
+    into_args = ', _numbers, _base'
+
+    def __init__(self, node, **kwargs):
+        super(NumericRenderGenerator, self).__init__(node, **kwargs)
+        self.constant_numbers = {}
+
+    def write_prologue(self):
+        self.writer.writeline('_params = []')
+        self.writer.writeline('_numbers = {}')
+
+    def is_loop_item(self, node):
+        """return whether node binds the item of an enclosing for-loop."""
+        root = node.ident.split('.')[0]
+        return root in [alias for (alias, depth) in self.loops]
+
+    def embed_args(self):
+        if self.loops:
+            return ', {}, _base'
+        return self.into_args
+
+    def write_number(self, value_expr, fresh=False):
+        """write the number of the variable named _k into _n, binding the
+        given value if the name is not bound yet, or always if fresh."""
+        w = self.writer
+        if fresh:
+            w.writeline('_params.append(%s)' % value_expr)
+            w.writeline('_n = len(_params)')
+            return
+        w.writeline('_n = _numbers.get(_k)')
+        w.writeline('if _n is None:')
+        w.push()
+        w.writeline('_params.append(%s)' % value_expr)
+        w.writeline('_n = _numbers[_k] = len(_params)')
+        w.pop()
+
+    def write_bind(self, node):
+        w = self.writer
+        self.write_bind_key(node)
+        fresh = self.is_loop_item(node)
+        numbers = fresh and '{}' or '_numbers'
+        w.writeline('if isinstance(_v, _iterable):')
+        w.push()
+        if self.array_binding is not None:
+            self.write_number('_array(_v)', fresh)
+            if self.gathering:
+                w.writeline('_g(-1)')
+            else:
+                w.writeline("_w(%r %% ('$' + str(_n + _base)))" % self.array_binding.placeholder)
+        else:
+            self.write_padding()
+            if self.gathering:
+                w.writeline('_g(_gather_numeric(_k, _v, _params, %s))' % numbers)
+            else:
+                w.writeline('_w(_expand_numeric(_k, _v, _params, %s, _base))' % numbers)
+        w.pop()
+        w.writeline('else:')
+        w.push()
+        self.write_number('_v', fresh)
+        if self.gathering:
+            w.writeline('_g(0)')
+        else:
+            w.writeline("_w('$' + str(_n + _base))")
+        w.pop()
+
+    def write_shape_key(self):
+        self.writer.writeline('if _base:')
+        self.writer.push()
+        self.writer.writeline('_sig = (_sig, _base)')
+        self.writer.pop()
+
+    def write_constant_shape_prologue(self):
+        self.writer.writeline('if _base:')
+        self.writer.push()
+        self.writer.writeline('return _shaped(data, _base)')
+        self.writer.pop()
+
+    def write_chunk_advance(self):
+        self.writer.writeline('_base += len(_params)')
+
+    def constant_placeholder(self, node):
+        numbers = self.constant_numbers
+        if node.ident not in numbers:
+            numbers[node.ident] = len(numbers) + 1
+        return '$%d' % numbers[node.ident]
+
+    def constant_params_expr(self, binds):
+        names = []
+        for (n, name) in binds:
+            if name not in names:
+                names.append(name)
+        return '[' + ', '.join(names) + ']'
+
+GENERATOR_FACTORY = {
+    'list': ListRenderGenerator,
+    'dict': DictRenderGenerator,
+
+    list: ListRenderGenerator,
+    dict: DictRenderGenerator,
+
+    # DB-API paramstyles
+    'qmark': ListRenderGenerator,
+    'named': DictRenderGenerator,
+    'format': FormatRenderGenerator,
+    'pyformat': PyformatRenderGenerator,
+    'numeric': NumericRenderGenerator,
+}
+
+def _expand_list(variable, params, placeholder='?'):
+    if not len(variable):
+        raise exc.RenderError("Binding data should not be empty.")
+    params.extend(variable)
+    return list_placeholders(len(variable), placeholder)
+
+def _expand_dict(ident, variable, params, named_placeholder=':%s'):
+    if not len(variable):
+        raise exc.RenderError("Binding data should not be empty.")
+    placeholders = []
+    for i, v in enumerate(variable):
+        ident_curr = ident + '_' + str(i+1)
+        placeholders.append(named_placeholder % ident_curr)
+        params[ident_curr] = v
+    return '(' + ', '.join(placeholders) + ')'
+
+def _expand_numeric(ident, variable, params, numbers, base):
+    if not len(variable):
+        raise exc.RenderError("Binding data should not be empty.")
+    placeholders = []
+    for i, v in enumerate(variable):
+        ident_curr = ident + '_' + str(i+1)
+        n = numbers.get(ident_curr)
+        if n is None:
+            params.append(v)
+            n = numbers[ident_curr] = len(params)
+        placeholders.append('$' + str(n + base))
+    return '(' + ', '.join(placeholders) + ')'
+
+def _gather_numeric(ident, variable, params, numbers):
+    if not len(variable):
+        raise exc.RenderError("Binding data should not be empty.")
+    for i, v in enumerate(variable):
+        ident_curr = ident + '_' + str(i+1)
+        if ident_curr not in numbers:
+            params.append(v)
+            numbers[ident_curr] = len(params)
+    return len(variable)
+
+def _gather_list(variable, params):
+    if not len(variable):
+        raise exc.RenderError("Binding data should not be empty.")
+    params.extend(variable)
+    return len(variable)
+
+def _gather_dict(ident, variable, params):
+    if not len(variable):
+        raise exc.RenderError("Binding data should not be empty.")
+    for i, v in enumerate(variable):
+        params[ident + '_' + str(i+1)] = v
+    return len(variable)
+
+def _get_generator(parameter_format):
+    try:
+        return GENERATOR_FACTORY[parameter_format]
+    except (KeyError, TypeError):
+        raise exc.ArgumentError("Unsupported parameter format: %s" % parameter_format)
+
+def generate_source(node, parameter_format='list', strict=True, list_padding=None, array_binds=None,
+                    stream=False):
+    """return the python source of the render function for the given tree."""
+    generator = _get_generator(parameter_format)(node, strict=strict,
+                                                 list_padding=list_padding,
+                                                 array_binds=array_binds,
+                                                 stream=stream)
+    return generator.generate()
+
+def compile_renderer(node, parameter_format='list', strict=True, list_padding=None, array_binds=None,
+                     stream=False):
+    """compile the given tree into a function taking the context data and
+    returning the query and its bound variables, like sqlgen.compile.
+
+    with list_padding, bound lists are padded as described in
+    sqlgen.get_list_padding.  with array_binds, the name of a dialect in
+    sqlgen.ARRAY_BINDINGS, bound lists are bound as a single array instead.
+
+    with stream, the function is a generator yielding the query in chunks,
+    each along with its own bound variables, as its for-loops run.  it
+    takes the number of query fragments per chunk as an optional second
+    argument.  otherwise the function has render_into and gather_into
+    attributes, which render the template embedded in another one.
+
+    """
+    # imported here, the template module depending on this one
+    from sqlshade.template import Template
+    generator = _get_generator(parameter_format)(node, strict=strict,
+                                                 list_padding=list_padding,
+                                                 array_binds=array_binds,
+                                                 stream=stream)
+    source = generator.generate()
+    namespace = dict(generator.namespace)
+    namespace.update({
+        '_iterable': ITERABLE_DATA_TYPES,
+        '_expand_list': _expand_list,
+        '_expand_dict': _expand_dict,
+        '_gather_list': _gather_list,
+        '_gather_dict': _gather_dict,
+        '_expand_numeric': _expand_numeric,
+        '_gather_numeric': _gather_numeric,
+        '_pad_list': pad_list,
+        '_list_padding': list_padding,
+        '_padded_length': get_list_padding(list_padding),
+        '_array_binds': array_binds,
+        '_array': generator.array_binding and generator.array_binding.convert,
+        '_shapes': {},
+        '_sequence': (list, tuple),
+        '_Unshaped': Unshaped,
+        '_shape_cache_size': SHAPE_CACHE_SIZE,
+        '_shape_max_signature': SHAPE_MAX_SIGNATURE,
+        '_shape_max_sql_length': SHAPE_MAX_SQL_LENGTH,
+        '_Node': tree.Node,
+        '_Template': Template,
+        '_Scope': Scope,
+        '_RenderError': exc.RenderError,
+        '_get_renderer': get_renderer,
+    })
+    code = compile(source, '<sqlshade render %s>' % (node.filename or 'memory'), 'exec')
+    exec code in namespace
+    render = namespace['render']
+    if not stream:
+        render.render_into = namespace['_render_into']
+        render.gather_into = namespace['_gather_into']
+    return render
+
+_renderer_cache = weakref.WeakKeyDictionary()
+
+def get_renderer(node, parameter_format='list', strict=True, list_padding=None, array_binds=None,
+                 stream=False):
+    """return the render function for the given tree, compiling it on first use."""
+    if isinstance(list_padding, list):
+        list_padding = tuple(list_padding)
+    key = (_get_generator(parameter_format), bool(strict), list_padding or None, array_binds or None,
+           bool(stream))
+    try:
+        renderers = _renderer_cache[node]
+    except KeyError:
+        renderers = _renderer_cache[node] = {}
+    except TypeError:
+        # not a TemplateNode; such nodes are not weakly referenceable
+        return compile_renderer(node, parameter_format, strict, list_padding, array_binds, stream)
+    try:
+        return renderers[key]
+    except KeyError:
+        renderer = renderers[key] = compile_renderer(node, parameter_format, strict,
+                                                     list_padding, array_binds, stream)
+        return renderer
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+"""provides the Executor class for running templates on DB-API connections."""
+
+from sqlshade import exc, util
+from sqlshade.template import Template
+
+class Executor(object):
+    """renders templates and executes them on a DB-API connection in one call.
+
+    the executor works on the given connection, or else on one obtained
+    from the given connect callable, such as the connect method of a
+    pool, when it is first needed; close() then closes that connection,
+    which gives it back to a pool.
+
+    cursors are kept per rendered query, up to cursor_cache_size of them,
+    and reused when the same query is executed again, so that a driver
+    caching prepared statements per cursor prepares each query once.  the
+    cursor returned by execute() is thus only valid until the next
+    execution of the same query.
+
+    templates are given as Template objects, or as uris of the given
+    TemplateLookup.  the parameter format of a template must be the
+    paramstyle of the driver.
+
+    an executor, like most connections, is not to be shared between threads.
+
+    """
+
+    def __init__(self, connection=None, connect=None, lookup=None, cursor_cache_size=100):
+        if (connection is None) == (connect is None):
+            raise exc.ArgumentError("Executor requires either a connection or a connect callable")
+        self._connection = connection
+        self._connect = connect
+        self.lookup = lookup
+        self._cursors = util.LRUCache(cursor_cache_size, on_evict=_close_cursor)
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = self._connect()
+        return self._connection
+
+    def get_template(self, template):
+        if isinstance(template, Template):
+            return template
+        if self.lookup is None:
+            raise exc.ArgumentError("Executor without lookup cant locate template '%s'" % template)
+        return self.lookup.get_template(template)
+
+    def cursor(self, query):
+        """return the cursor kept for the given query, creating it if needed."""
+        cursor = self._cursors.get(query)
+        if cursor is None:
+            cursor = self._cursors[query] = self.connection.cursor()
+        return cursor
+
+    def execute(self, template, **context):
+        """render the template with the given context and execute it,
+        returning the cursor."""
+        (query, bound_variables) = self.get_template(template).render(**context)
+        cursor = self.cursor(query)
+        cursor.execute(query, bound_variables)
+        return cursor
+
+    def executemany(self, template, contexts):
+        """render the template once per context and execute the query
+        with the bound variables of every context, returning the cursor,
+        or None if there is no context.
+
+        every context must render to the same query; see
+        Template.render_executemany.
+
+        """
+        (query, rows) = self.get_template(template).render_executemany(contexts)
+        if query is None:
+            return None
+        cursor = self.cursor(query)
+        cursor.executemany(query, rows)
+        return cursor
+
+    def fetchone(self, template, **context):
+        return self.execute(template, **context).fetchone()
+
+    def fetchmany(self, template, size, **context):
+        return self.execute(template, **context).fetchmany(size)
+
+    def fetchall(self, template, **context):
+        return self.execute(template, **context).fetchall()
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def close(self):
+        """close the kept cursors, and the connection if it was obtained
+        from the connect callable."""
+        for cursor in self._cursors.values():
+            _close_cursor(None, cursor)
+        self._cursors.clear()
+        if self._connect is not None and self._connection is not None:
+            (connection, self._connection) = (self._connection, None)
+            connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def _close_cursor(query, cursor):
+    try:
+        cursor.close()
+    except Exception:
+        pass
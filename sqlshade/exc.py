@@ -11,6 +11,9 @@ class RenderError(Error):
 class ArgumentError(Error):
     pass
 
+class TemplateLookupError(Error):
+    pass
+
 def _format_filepos(lineno, pos, filename):
     if filename is None:
         return " at line: %d char: %d" % (lineno, pos)
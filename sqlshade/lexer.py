@@ -2,7 +2,7 @@
 
 """provides the Lexer class for parsing template strings into parse trees."""
 
-import re, codecs
+import re, codecs, bisect
 from sqlshade import tree, exc
 
 _regexp_cache = {}
@@ -12,6 +12,106 @@ should_be_end_char_rules = {
     "'": "'",
 }
 
+_literal_pattern = r"""(?:[^-/\\]+|-(?!-)|/(?!\*)|\\(?!\r?\n))*"""
+
+# a single pattern classifying the token at the current position, tried
+# in the order: comment, substitute comment, control comment start,
+# control comment end and literal.
+_token_reg = re.compile(r"""
+    (?P<comment>
+     /\*(?P<block_comment>[^:\#].*?)\*/  # multiline comment
+     |
+     --(?P<line_comment>[^\n\r]*)       # singleline comment
+    )
+    |
+    (?P<substitute_comment>
+     /\*:(?P<ident>[\w.]+?)\*/          # placeholder, followed by
+     (?=[\w'(+-])                      # its fake value
+    )
+    |
+    (?P<control_comment_start>
+     /\*\#(?!/|end)                     # opening
+     (?P<keyword>\w+)                  # keyword
+     (?P<text>(?:\s+[\w./-]+)*)        # text
+     \s*                               # more whitespace
+     \*/                               # closing
+    )
+    |
+    (?P<control_comment_end>
+     /\*\#(?:/|end)[\t\ ]*(?P<end_keyword>\w+?)[\t\ ]*\*/
+    )
+    |
+    (?P<literal>
+     (?P<literal_text>%s)  # anything, followed by:
+     (?:
+      (?=--|/\*)                        # a comment
+      |
+      \\\r?\n                          # an escaped newline - throw away
+      |
+      \Z                               # end of string
+     )
+    )
+    """ % _literal_pattern, re.X | re.S)
+
+_unmatched_comment_reg = re.compile(r"/\*" + _literal_pattern)
+_string_literal_reg = re.compile(r"(\'(?:[^\\]|(\\.))*?\')")
+_number_literal_reg = re.compile(r"([+-]?[\d.]+)")
+
+_sqlword_default_end = set([' ', '\n', '\r'])
+
+def _sqlword_plain_reg(end):
+    """return a pattern matching a run of characters which neither end a sql
+    word nor change its nesting."""
+    return re.compile(r"[^()'\\%s]+" % re.escape(''.join(end)))
+
+_sqlword_plain_regs = {
+    None: _sqlword_plain_reg(_sqlword_default_end),
+    ')': _sqlword_plain_reg(set([')'])),
+    "'": _sqlword_plain_reg(set(["'"])),
+}
+_sqlword_string_reg = re.compile(r"[^'\\]+")
+
+_magic_encoding_reg = re.compile(r'#.*coding[:=]\s*([-\w.]+).*\r?\n')
+
+def detect_encoding(data, filename=None):
+    """return the length of the utf-8 BOM starting the given template
+    bytes, if any, and the encoding declared by the BOM or by a magic
+    encoding comment on the first line, or None.
+
+    the bytes may also be a buffer such as an mmap.
+
+    """
+    if data[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8:
+        offset = len(codecs.BOM_UTF8)
+        match = _magic_encoding_reg.match(data, offset)
+        if match is not None and match.group(1) != 'utf-8':
+            raise exc.CompileError("Found utf-8 BOM in file, with conflicting magic encoding comment of '%s'" % match.group(1), _error_source(data), 0, 0, filename)
+        return (offset, 'utf-8')
+    match = _magic_encoding_reg.match(data)
+    return (0, match and match.group(1))
+
+def decode_source(data, offset=0, encoding=None, filename=None):
+    """decode the given template bytes from offset on, in a single pass
+    over a buffer of them rather than a copy."""
+    if encoding:
+        try:
+            return unicode(buffer(data, offset), encoding)
+        except UnicodeDecodeError, e:
+            raise exc.CompileError("Unicode decode operation of encoding '%s' failed" % encoding, _error_source(data), 0, 0, filename)
+    else:
+        try:
+            return unicode(buffer(data, offset))
+        except UnicodeDecodeError, e:
+            raise exc.CompileError("Could not read template using encoding of 'ascii'.  Did you forget a magic encoding comment?", _error_source(data), 0, 0, filename)
+
+def _error_source(data):
+    return str(buffer(data)).decode('utf-8', 'ignore')
+
+def _newline_offsets(text):
+    return [m.start() for m in _newline_reg.finditer(text)]
+
+_newline_reg = re.compile(r"\n")
+
 class Lexer(object):
 
     def __init__(self, text, filename=None, disable_unicode=False, input_encoding=None):
@@ -19,13 +119,45 @@ class Lexer(object):
         self.filename = filename
         self.template = tree.TemplateNode(self.filename)
         self.control_comment = []
-        self.matched_lineno = 1
-        self.matched_charpos = 0
-        self.lineno = 1
+        self.matched_offset = None
         self.match_position = 0
+        self.newline_offsets = None
         self.disable_unicode = disable_unicode
         self.encoding = input_encoding
 
+    @property
+    def matched_lineno(self):
+        """the line of the last match, starting from 1."""
+        if self.matched_offset is None:
+            return 1
+        return self.position(self.matched_offset)[0]
+
+    @property
+    def matched_charpos(self):
+        """the column of the last match, starting from 1."""
+        if self.matched_offset is None:
+            return 0
+        return self.position(self.matched_offset)[1]
+
+    @property
+    def lineno(self):
+        """the line of the current text position."""
+        return self.position(self.match_position)[0]
+
+    def position(self, offset):
+        """return the line and column of the given offset in the text.
+
+        the offsets of newlines are collected once, on first use, and looked
+        up by bisection."""
+        newlines = self.newline_offsets
+        if newlines is None:
+            newlines = self.newline_offsets = _newline_offsets(self.text)
+        index = bisect.bisect_left(newlines, offset)
+        if index:
+            return (index + 1, offset - newlines[index - 1])
+        else:
+            return (1, offset + 1)
+
     @property
     def exception_kwargs(self):
         return {'source': self.text, 'lineno': self.matched_lineno, 'pos': self.matched_charpos, 'filename': self.filename}
@@ -34,7 +166,6 @@ class Lexer(object):
         """match the given regular expression string and flags to the current text position.
         
         if a match occurs, update the current text and line position."""
-        mp = self.match_position
         try:
             reg = _regexp_cache[(regexp, flags)]
         except KeyError:
@@ -43,30 +174,30 @@ class Lexer(object):
             else:
                 reg = re.compile(regexp)
             _regexp_cache[(regexp, flags)] = reg
+        return self.match_reg(reg)
 
+    def match_reg(self, reg):
+        """match the given compiled regular expression to the current text position.
+
+        if a match occurs, update the current text and line position."""
         match = reg.match(self.text, self.match_position)
         if match:
             (start, end) = match.span()
             if end == start:
-                self.match_position = end + 1
+                self.advance(end + 1)
             else:
-                self.match_position = end
-            self.matched_lineno = self.lineno
-            lines = re.findall(r"\n", self.text[mp:self.match_position])
-            cp = mp - 1
-            while (cp >= 0 and cp<self.textlength and self.text[cp] != '\n'):
-                cp -=1
-            self.matched_charpos = mp - cp
-            self.lineno += len(lines)
-            #print "MATCHED:", match.group(0), "LINE START:", self.matched_lineno, "LINE END:", self.lineno
-        #print "MATCH:", regexp, "\n", self.text[mp : mp + 15], (match and "TRUE" or "FALSE")
+                self.advance(end)
         return match
 
+    def advance(self, end):
+        """move the current text position to end, recording the offset of the match."""
+        self.matched_offset = self.match_position
+        self.match_position = end
+
     def append_node(self, nodecls, *args, **kwargs):
-        kwargs.setdefault('source', self.text)
         kwargs.setdefault('lineno', self.matched_lineno)
         kwargs.setdefault('pos', self.matched_charpos)
-        kwargs['filename'] = self.filename
+        kwargs['template'] = self.template
         node = nodecls(*args, **kwargs)
         if len(self.control_comment):
             self.control_comment[-1].nodes.append(node)
@@ -78,118 +209,133 @@ class Lexer(object):
             self.control_comment.append(node)
 
     def parse(self):
-        if not isinstance(self.text, unicode) and self.text.startswith(codecs.BOM_UTF8):
-            self.text = self.text[len(codecs.BOM_UTF8):]
-            parsed_encoding = 'utf-8'
-            me = self.match_encoding()
-            if me is not None and me != 'utf-8':
-                raise exc.CompileError("Found utf-8 BOM in file, with conflicting magic encoding comment of '%s'" % me, self.text.decode('utf-8', 'ignore'), 0, 0, self.filename)
-        else:
-            parsed_encoding = self.match_encoding()
-        if parsed_encoding:
-            self.encoding = parsed_encoding
-        if not self.disable_unicode and not isinstance(self.text, unicode):
-            if self.encoding:
-                try:
-                    self.text = self.text.decode(self.encoding)
-                except UnicodeDecodeError, e:
-                    raise exc.CompileError("Unicode decode operation of encoding '%s' failed" % self.encoding, self.text.decode('utf-8', 'ignore'), 0, 0, self.filename)
-            else:
-                try:
-                    self.text = self.text.decode()
-                except UnicodeDecodeError, e:
-                    raise exc.CompileError("Could not read template using encoding of 'ascii'.  Did you forget a magic encoding comment?", self.text.decode('utf-8', 'ignore'), 0, 0, self.filename)
+        if not isinstance(self.text, unicode):
+            (offset, parsed_encoding) = detect_encoding(self.text, self.filename)
+            if parsed_encoding:
+                self.encoding = parsed_encoding
+            if not self.disable_unicode:
+                self.text = decode_source(self.text, offset, self.encoding, self.filename)
+            elif offset:
+                self.text = self.text[offset:]
+        # skip the magic encoding comment
+        self.match_encoding()
 
         self.textlength = len(self.text)
+        self.newline_offsets = None
+        self.template.source = self.text
 
-        while (True):
-            if self.match_position > self.textlength:
-                break
-
-            if self.match_end():
-                break
-            if self.match_comment():
-                continue
-            if self.match_substitute_comment():
-                continue
-            if self.match_control_comment_start():
-                continue
-            if self.match_control_comment_end():
-                continue
-            if self.match_literal():
-                continue
-
-            if self.match_position > self.textlength:
-                break
-            raise exc.CompileError("assertion failed")
+        dispatch = {
+            'comment': self.parse_comment,
+            'substitute_comment': self.parse_substitute_comment,
+            'control_comment_start': self.parse_control_comment_start,
+            'control_comment_end': self.parse_control_comment_end,
+            'literal': self.parse_literal,
+        }
+        (text, textlength, match_token) = (self.text, self.textlength, _token_reg.match)
+        while self.match_position < textlength:
+            match = match_token(text, self.match_position)
+            self.advance(match.end())
+            dispatch[match.lastgroup](match)
+        self.advance(textlength)
 
         if len(self.control_comment):
             raise exc.SyntaxError("Unterminated control comment: /*#%s*/" % self.control_comment[-1].keyword, **self.exception_kwargs)
         return self.template
 
     def match_encoding(self):
-        match = self.match(r'#.*coding[:=]\s*([-\w.]+).*\r?\n')
+        match = self.match_reg(_magic_encoding_reg)
         if match:
             return match.group(1)
         else:
             return None
 
-    def match_substitute_comment(self):
-        match = self.match(r"""/\*:([\w.]+?)\*/(?=[\w'(+-])""")
-        if match:
-            (ident, fake_value_prefix) = (match.group(1), self.text[self.match_position])
-            if fake_value_prefix == "'":
-                m = self.match(r"(\'(?:[^\\]|(\\.))*?\')")
-                if not m:
-                    raise exc.SyntaxError("Invalid string literal", **self.exception_kwargs)
-                text = m.group(1)
-            elif fake_value_prefix in ('+', '-', '0', '1', '2', '3', '4', '5', '6', '7', '8', '9'):
-                m = self.match(r"([+-]?[\d.]+)")
-                if not m:
-                    raise exc.SyntaxError("Invalid number literal", **self.exception_kwargs)
-                text = m.group(1)
-            else:
-                text = self.parse_sqlliteral_end()
-            self.append_node(tree.SubstituteComment, ident, text)
-            return True
+    def parse_comment(self, match):
+        is_multiline = match.group('block_comment') is not None
+        text = match.group('block_comment') if is_multiline else match.group('line_comment')
+        self.append_node(tree.Comment, text, is_multiline)
+
+    def parse_substitute_comment(self, match):
+        (ident, fake_value_prefix) = (match.group('ident'), self.text[self.match_position])
+        if fake_value_prefix == "'":
+            m = self.match_reg(_string_literal_reg)
+            if not m:
+                raise exc.SyntaxError("Invalid string literal", **self.exception_kwargs)
+            text = m.group(1)
+        elif fake_value_prefix in ('+', '-', '0', '1', '2', '3', '4', '5', '6', '7', '8', '9'):
+            m = self.match_reg(_number_literal_reg)
+            if not m:
+                raise exc.SyntaxError("Invalid number literal", **self.exception_kwargs)
+            text = m.group(1)
         else:
-            return False
+            text = self.parse_sqlliteral_end()
+        self.append_node(tree.SubstituteComment, ident, text)
+
+    def parse_control_comment_start(self, match):
+        (keyword, text) = (match.group('keyword'), match.group('text'))
+        self.keyword = keyword
+        self.append_node(tree.ControlComment, keyword, text)
+
+    def parse_control_comment_end(self, match):
+        keyword = match.group('end_keyword')
+        if not len(self.control_comment):
+            raise exc.SyntaxError("Closing control without opening control: /*#/%s*/" % keyword, **self.exception_kwargs)
+        elif self.control_comment[-1].keyword != keyword:
+            raise exc.SyntaxError("Closing control /*#/%s*/ does not match control: /*#%s*/" % (keyword, self.control_comment[-1].keyword), **self.exception_kwargs)
+        self.control_comment.pop()
+
+    def parse_literal(self, match):
+        text = match.group('literal_text')
+        if not match.group('literal'):
+            # a comment opening which is neither a comment, a placeholder
+            # nor a control; keep it as literal text.
+            match = self.match_reg(_unmatched_comment_reg)
+            text = match.group()
+        self.append_node(tree.Literal, text)
 
     def parse_sqlliteral_end(self):
         start = self.match_position
-        text = self.text[start:]
-        should_end_char = should_be_end_char_rules.get(text[0], None)
-        end = self.parse_until_end_of_sqlword(text, should_end_char)
+        should_end_char = should_be_end_char_rules.get(self.text[start], None)
+        end = self.parse_until_end_of_sqlword(self.text, should_end_char, start)
         if end != -1:
             end += start
             if end == start:
-                self.match_position = end + 1
+                self.advance(end + 1)
             else:
-                self.match_position = end
-            text = self.text[start:end]
-            self.matched_lineno = self.lineno
-            lines = re.findall(r"\n", text)
-            cp = start - 1
-            while (0 <= cp < self.textlength and self.text[cp] != '\n'):
-                cp -= 1
-            self.matched_charpos = start - cp
-            self.lineno += len(lines)
-            return text
+                self.advance(end)
+            return self.text[start:end]
         else:
             raise exc.SyntaxError("Invalid fake value literal", **self.exception_kwargs)
 
     @staticmethod
-    def parse_until_end_of_sqlword(text, should_be_end_char=None):
-        if not text:
+    def parse_until_end_of_sqlword(text, should_be_end_char=None, pos=0):
+        """return the length of the sql word starting at pos in text, or -1.
+
+        the word ends at should_be_end_char, which is included, or else at
+        whitespace, outside of parentheses and quoted strings.  runs of
+        characters which cannot end the word nor change the nesting are
+        skipped with a regular expression, and the text is never sliced.
+
+        """
+        length = len(text)
+        if pos >= length:
             return -1
         (stack, string, escape) = (0, False, False)
         if should_be_end_char is not None:
             end = set([should_be_end_char])
             offset = 1
         else:
-            end = set([' ', '\n', '\r'])
+            end = _sqlword_default_end
             offset = 0
-        for i, c in enumerate(text):
+        plain_reg = _sqlword_plain_regs.get(should_be_end_char) or _sqlword_plain_reg(end)
+        (i, c) = (pos, None)
+        while i < length:
+            if escape is False:
+                m = (_sqlword_string_reg if string else plain_reg).match(text, i)
+                if m is not None:
+                    i = m.end()
+                    c = text[i - 1]
+                    continue
+            c = text[i]
             if string is False:
                 if c == '(':
                     stack += 1
@@ -202,90 +348,10 @@ class Lexer(object):
                     escape = True
             else:
                 escape = False
-            if stack == 0 and string is False and c in end and i > 0:
-                return i + offset
-        else:
-            if stack == 0 and string is False and c not in end:
-                return i + 1
-            else:
-                return -1
-
-    def match_control_comment_start(self):
-        match = self.match(r'''
-            /\*\#(?!\/|end)  # opening
-            
-            (\w+)      # keyword
-            
-            ((?:\s+\w+)*)  # text
-            
-            \s*              # more whitespace
-            
-            \*/              # closing
-            ''', re.S | re.X)
-
-        if match:
-            (keyword, text) = (match.group(1), match.group(2))
-            self.keyword = keyword
-            self.append_node(tree.ControlComment, keyword, text)
-            return True
-        else:
-            return False
-
-    def match_control_comment_end(self):
-        match = self.match(r"""/\*#(?:/|end)[\t ]*(\w+?)[\t ]*\*/""")
-        if match:
-            if not len(self.control_comment):
-                raise exc.SyntaxError("Closing control without opening control: /*#/%s*/" % match.group(1), **self.exception_kwargs)
-            elif self.control_comment[-1].keyword != match.group(1):
-                raise exc.SyntaxError("Closing control /*#/%s*/ does not match control: /*#%s*/" % (match.group(1), self.control_comment[-1].keyword), **self.exception_kwargs)
-            self.control_comment.pop()
-            return True
-        else:
-            return False
-
-    def match_end(self):
-        match = self.match(r'\Z', re.S)
-        if match:
-            string = match.group()
-            if string:
-                return string
-            else:
-                return True
-        else:
-            return False
-
-    def match_literal(self):
-        match = self.match(r"""
-            (.*?)   # anything, followed by:
-            (
-             (?=--) # singleline comment
-             |
-             (?=\/\*)  # multiline comment
-             |
-             (\\\r?\n)  # an escaped newline - throw away
-             |
-             \Z     # end of string
-            )""", re.X | re.S)
-
-        if match:
-            text = match.group(1)
-            self.append_node(tree.Literal, text)
-            return True
+            if stack == 0 and string is False and c in end and i > pos:
+                return i - pos + offset
+            i += 1
+        if stack == 0 and string is False and c not in end:
+            return length - pos
         else:
-            return False
-
-    def match_comment(self):
-        """matches the multiline version of a comment"""
-        match = self.match(r"""
-            (?:
-             /\*([^:#].*?)\*/
-             |
-             --([^\n\r]*)
-            )
-            """, re.S | re.X)
-        if match:
-            is_multiline = match.group(1) is not None
-            text = match.group(1) if is_multiline else match.group(2)
-            self.append_node(tree.Comment, text, is_multiline)
-        else:
-            return False
+            return -1
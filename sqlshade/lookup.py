@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""provides the TemplateLookup class for loading templates from directories."""
+
+import os
+import posixpath
+import threading
+import time
+
+from sqlshade import exc, util
+from sqlshade.template import Template
+
+class TemplateLookup(object):
+    """locates, compiles and caches templates stored in one or more directories.
+
+    templates are looked up by a uri relative to the directories, searched in
+    order.  compiled templates are kept in a cache of at most collection_size
+    entries, 500 by default or unbounded when negative, discarding the least
+    recently used.
+
+    with filesystem_checks enabled, the file of a cached template is stat()ed
+    again when more than check_interval seconds have passed since the last
+    check, and the template is recompiled if its mtime or size changed.
+
+    with cache_dir given, parse trees are also kept on disk so that a new
+    process does not parse the same files again; see cache.CompileCache.
+
+    templates found in the lookup may include others with the include
+    control; when filesystem_checks find an included template changed,
+    the including template is recompiled as well.
+
+    a lookup may be shared between threads.
+
+    """
+
+    def __init__(self,
+                 directories=None,
+                 filesystem_checks=True,
+                 check_interval=0,
+                 collection_size=500,
+                 input_encoding=None,
+                 output_encoding=None,
+                 disable_unicode=False,
+                 strict=True,
+                 parameter_format='list',
+                 cache_dir=None,
+                 list_padding=None,
+                 array_binds=None):
+        if isinstance(directories, basestring):
+            directories = [directories]
+        self.directories = [os.path.normpath(d) for d in directories or []]
+        self.filesystem_checks = filesystem_checks
+        self.check_interval = check_interval
+        self.collection_size = collection_size
+        self.template_args = {
+            'input_encoding': input_encoding,
+            'output_encoding': output_encoding,
+            'disable_unicode': disable_unicode,
+            'strict': strict,
+            'parameter_format': parameter_format,
+            'cache_dir': cache_dir,
+            'list_padding': list_padding,
+            'array_binds': array_binds,
+            'lookup': self,
+        }
+        self._collection = util.LRUCache(collection_size)
+        self._memory = {}
+        # reentrant, as loading a template loads the templates it includes
+        self._mutex = threading.RLock()
+
+    def get_template(self, uri):
+        """return the Template for the given uri, raising TemplateLookupError
+        if it cannot be found."""
+        uri = self.adjust_uri(uri)
+        if uri in self._memory:
+            return self._memory[uri]
+        self._mutex.acquire()
+        try:
+            entry = self._collection.get(uri)
+            if entry is None:
+                return self._load(uri)
+            if self.filesystem_checks:
+                return self._check(uri, entry)
+            return entry.template
+        finally:
+            self._mutex.release()
+
+    def has_template(self, uri):
+        try:
+            self.get_template(uri)
+            return True
+        except exc.TemplateLookupError:
+            return False
+
+    def put_string(self, uri, text):
+        """place a new Template built from the given text in this lookup.
+
+        such templates are never discarded from the lookup nor checked."""
+        uri = self.adjust_uri(uri)
+        self._memory[uri] = Template(text, uri=uri, **self.template_args)
+
+    def put_template(self, uri, template):
+        """place the given Template in this lookup."""
+        self._memory[self.adjust_uri(uri)] = template
+
+    def adjust_uri(self, uri):
+        """normalize the given uri, refusing ones that escape the directories."""
+        uri = posixpath.normpath('/' + uri.replace(os.sep, '/')).lstrip('/')
+        if not uri or uri == '.':
+            raise exc.TemplateLookupError("Invalid template uri: '%s'" % uri)
+        return uri
+
+    def _find(self, uri):
+        for directory in self.directories:
+            srcfile = os.path.join(directory, *uri.split('/'))
+            if os.path.isfile(srcfile):
+                return srcfile
+        raise exc.TemplateLookupError("Cant locate template for uri '%s'" % uri)
+
+    def _load(self, uri, srcfile=None):
+        if srcfile is None:
+            srcfile = self._find(uri)
+        try:
+            st = os.stat(srcfile)
+            template = Template.from_file(srcfile, uri=uri, **self.template_args)
+        except (IOError, OSError):
+            self._collection.pop(uri, None)
+            raise exc.TemplateLookupError("Cant read template file '%s'" % srcfile)
+        self._collection[uri] = _Entry(template, srcfile, st, time.time())
+        return template
+
+    def _check(self, uri, entry):
+        now = time.time()
+        if now - entry.checked < self.check_interval:
+            return entry.template
+        try:
+            st = os.stat(entry.srcfile)
+        except OSError:
+            del self._collection[uri]
+            raise exc.TemplateLookupError("Cant locate template for uri '%s'" % uri)
+        if (st.st_mtime, st.st_size) != (entry.mtime, entry.size):
+            return self._load(uri, entry.srcfile)
+        for (included_uri, included) in entry.template.includes:
+            try:
+                current = self.get_template(included_uri)
+            except exc.TemplateLookupError:
+                current = None
+            if current is not included:
+                return self._load(uri, entry.srcfile)
+        entry.checked = now
+        return entry.template
+
+class _Entry(object):
+    """a compiled template along with the state of its file when it was read."""
+
+    __slots__ = ('template', 'srcfile', 'mtime', 'size', 'checked')
+
+    def __init__(self, template, srcfile, st, checked):
+        self.template = template
+        self.srcfile = srcfile
+        self.mtime = st.st_mtime
+        self.size = st.st_size
+        self.checked = checked
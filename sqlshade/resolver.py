@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+"""provides the Resolver class for looking up identifiers in the render data."""
+
+import weakref
+
+class Resolver(object):
+    """looks up an identifier such as 'item.firstname' in the render data.
+
+    the identifier is split once, when the template is parsed.  its first
+    name is a key of the render data; each following name is a key of a
+    mapping or else an attribute of an object.  which of the two applies is
+    decided once per type of value and remembered for as long as the type
+    lives.
+
+    a missing key or attribute raises KeyError.
+
+    """
+
+    __slots__ = ('ident', 'first', 'rest')
+
+    def __init__(self, ident):
+        self.ident = ident
+        names = ident.split('.')
+        if '' in names:
+            (self.first, self.rest) = (None, ())
+        else:
+            (self.first, self.rest) = (names[0], tuple(names[1:]))
+
+    def __call__(self, data):
+        if self.first is None:
+            raise KeyError(self.ident)
+        value = data[self.first]
+        for name in self.rest:
+            try:
+                access = _accessors[value.__class__]
+            except KeyError:
+                access = _accessors[value.__class__] = _accessor_for(value.__class__)
+            value = access(value, name)
+        return value
+
+    def __repr__(self):
+        return "Resolver(%r)" % self.ident
+
+def _get_item(value, name):
+    return value[name]
+
+def _get_attribute(value, name):
+    try:
+        return getattr(value, name)
+    except AttributeError:
+        raise KeyError(name)
+
+def _accessor_for(cls):
+    if hasattr(cls, '__getitem__') and hasattr(cls, 'keys'):
+        return _get_item
+    return _get_attribute
+
+# weakly keyed, so as not to keep classes made on the fly alive
+_accessors = weakref.WeakKeyDictionary({dict: _get_item})
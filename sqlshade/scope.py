@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+"""provides the Scope class, the render data seen inside for-loops."""
+
+class Scope(object):
+    """a frame binding one name over the render data of the enclosing block.
+
+    for-loops make a frame per item holding the loop alias, rather than
+    storing it into the render data, so the data given by the caller is
+    only ever read: it is neither copied nor changed, and may be rendered
+    from by several threads at once.  a frame is not changed either once
+    made.
+
+    names not bound by a frame are looked up in its parent, that is either
+    an enclosing frame or the render data itself.
+
+    """
+
+    __slots__ = ('parent', 'name', 'value')
+
+    def __init__(self, parent, name, value):
+        self.parent = parent
+        self.name = name
+        self.value = value
+
+    def __getitem__(self, key):
+        scope = self
+        while scope.__class__ is Scope:
+            if scope.name == key:
+                return scope.value
+            scope = scope.parent
+        return scope[key]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __repr__(self):
+        return "Scope(%r, %r, %r)" % (self.parent, self.name, self.value)
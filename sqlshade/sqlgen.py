@@ -1,17 +1,164 @@
+import datetime
+import decimal
+import json
+
 from sqlshade import exc, util, tree
 from sqlshade.lexer import Lexer
+from sqlshade.resolver import Resolver
+from sqlshade.scope import Scope
 
 def compile(node, filename, data,
             source_encoding=None,
             generate_unicode=True,
             strict=True,
-            parameter_format='list'):
-    render_context = RenderContext(data, strict=strict)
+            parameter_format='list',
+            list_padding=None,
+            array_binds=None):
+    render_context = RenderContext(data, strict=strict,
+                                   list_padding=get_list_padding(list_padding),
+                                   array_binding=get_array_binding(array_binds))
     if parameter_format in RENDER_FACTORY:
         return RENDER_FACTORY[parameter_format](node, render_context)
     else:
         raise exc.ArgumentError("Unsupported parameter format: %s" % parameter_format)
 
+def compile_chunks(node, filename, data,
+                   max_params=None,
+                   max_size=None,
+                   strict=True,
+                   parameter_format='list',
+                   list_padding=None,
+                   array_binds=None):
+    """render the given tree as one or more statements of at most
+    max_params bound variables and max_size characters each, yielding the
+    query and bound variables of every statement.
+
+    the items of the outermost for-loop of the template are split among
+    the statements, which all repeat the rest of the template.  the
+    items are rendered as the loop is run, so it may run over any
+    iterable.  RenderError is raised when a statement cannot be made small
+    enough.
+
+    """
+    render_context = RenderContext(data, strict=strict,
+                                   list_padding=get_list_padding(list_padding),
+                                   array_binding=get_array_binding(array_binds))
+    try:
+        (statement_cls, split_statement_cls, printer_cls) = CHUNK_FACTORY[parameter_format]
+    except (KeyError, TypeError):
+        raise exc.ArgumentError("Unsupported parameter format: %s" % parameter_format)
+    printer = printer_cls(util.FastEncodingBuffer())
+    splitter = split_statement_cls(printer, render_context, node)
+    (query, bound_variables) = printer.freeze()
+    limits = _StatementLimits(max_params, max_size)
+    if splitter.loop is None:
+        limits.check(len(bound_variables), len(query))
+        yield query, bound_variables
+        return
+
+    if isinstance(printer, NumericStatementPrinter):
+        for statement in _compile_numeric_chunks(statement_cls, printer, splitter, limits):
+            yield statement
+        return
+
+    (loop_node, loop_context, variable, query_pos, params_pos) = splitter.loop
+    (prefix, suffix) = (query[:query_pos], query[query_pos:])
+    # the names a row binds again are counted once per statement
+    if isinstance(bound_variables, dict):
+        def make_statement(rows):
+            params = dict(bound_variables)
+            for (q, b) in rows:
+                params.update(b)
+            return prefix + ''.join([q for (q, b) in rows]) + suffix, params
+        def count_new(keys, row_bound_variables):
+            return len([k for k in row_bound_variables if k not in keys])
+        def start():
+            return set(bound_variables)
+    else:
+        def make_statement(rows):
+            params = bound_variables[:params_pos]
+            for (q, b) in rows:
+                params.extend(b)
+            params.extend(bound_variables[params_pos:])
+            return prefix + ''.join([q for (q, b) in rows]) + suffix, params
+        def count_new(keys, row_bound_variables):
+            return len(row_bound_variables)
+        def start():
+            return None
+
+    (fixed_params, fixed_size) = (len(bound_variables), len(query))
+    (rows, statements) = ([], 0)
+    (n_params, size, keys) = (fixed_params, fixed_size, start())
+    for for_block_context in splitter.iterate_for(loop_node, loop_context, variable):
+        row_printer = printer_cls(util.FastEncodingBuffer())
+        statement_cls(row_printer, for_block_context, loop_node)
+        (row_query, row_bound_variables) = row_printer.freeze()
+        new_params = count_new(keys, row_bound_variables)
+        if rows and not limits.fit(n_params + new_params, size + len(row_query)):
+            yield make_statement(rows)
+            (rows, statements) = ([], statements + 1)
+            (n_params, size, keys) = (fixed_params, fixed_size, start())
+            new_params = count_new(keys, row_bound_variables)
+        if not rows:
+            limits.check(n_params + new_params, size + len(row_query))
+        rows.append((row_query, row_bound_variables))
+        n_params += new_params
+        size += len(row_query)
+        if keys is not None:
+            keys.update(row_bound_variables)
+    if rows or not statements:
+        yield make_statement(rows)
+
+def _compile_numeric_chunks(statement_cls, printer, splitter, limits):
+    """split a template bound by number, numbering the variables of every
+    statement from $1 and reusing the numbers of the keys it binds again."""
+    (query, bound_variables) = printer.freeze()
+    (loop_node, loop_context, variable, query_pos, params_pos) = splitter.loop
+    (prefix, suffix) = (query[:query_pos], query[query_pos:])
+
+    def render_row(context, numbers, params):
+        row_printer = RowNumericStatementPrinter(util.FastEncodingBuffer(), numbers, len(params))
+        statement_cls(row_printer, context, loop_node)
+        return row_printer
+
+    def start():
+        return ([], list(bound_variables), dict(printer._numbers), len(query))
+
+    (rows, params, numbers, size) = start()
+    statements = 0
+    for for_block_context in splitter.iterate_for(loop_node, loop_context, variable):
+        row_printer = render_row(for_block_context, numbers, params)
+        (row_query, row_bound_variables) = row_printer.freeze()
+        if rows and not limits.fit(len(params) + len(row_bound_variables), size + len(row_query)):
+            yield prefix + ''.join(rows) + suffix, params
+            statements += 1
+            (rows, params, numbers, size) = start()
+            # numbered afresh in the new statement
+            row_printer = render_row(for_block_context, numbers, params)
+            (row_query, row_bound_variables) = row_printer.freeze()
+        limits.check(len(params) + len(row_bound_variables), size + len(row_query))
+        rows.append(row_query)
+        params.extend(row_bound_variables)
+        numbers.update(row_printer._numbers)
+        size += len(row_query)
+    if rows or not statements:
+        yield prefix + ''.join(rows) + suffix, params
+
+class _StatementLimits(object):
+
+    def __init__(self, max_params, max_size):
+        self.max_params = max_params
+        self.max_size = max_size
+
+    def fit(self, n_params, size):
+        return ((self.max_params is None or n_params <= self.max_params) and
+                (self.max_size is None or size <= self.max_size))
+
+    def check(self, n_params, size):
+        if not self.fit(n_params, size):
+            raise exc.RenderError("Statement exceeds limits: %d bound variables, %d characters" %
+                                  (n_params, size))
+
 def render_as_list_params(node, context):
     printer = ListStatementPrinter(util.FastEncodingBuffer())
     RenderListStatement(printer, context, node)
@@ -22,24 +169,48 @@ def render_as_dict_params(node, context):
     RenderDictStatement(printer, context, node)
     return printer.freeze()
 
+def render_as_format_params(node, context):
+    printer = ListStatementPrinter(util.FastEncodingBuffer())
+    RenderFormatStatement(printer, context, node)
+    return printer.freeze()
+
+def render_as_pyformat_params(node, context):
+    printer = DictStatementPrinter(util.FastEncodingBuffer())
+    RenderPyformatStatement(printer, context, node)
+    return printer.freeze()
+
+def render_as_numeric_params(node, context):
+    printer = NumericStatementPrinter(util.FastEncodingBuffer())
+    RenderNumericStatement(printer, context, node)
+    return printer.freeze()
+
 RENDER_FACTORY = {
     'list': render_as_list_params,
     'dict': render_as_dict_params,
 
     list: render_as_list_params,
     dict: render_as_dict_params,
+
+    # DB-API paramstyles
+    'qmark': render_as_list_params,
+    'named': render_as_dict_params,
+    'format': render_as_format_params,
+    'pyformat': render_as_pyformat_params,
+    'numeric': render_as_numeric_params,
 }
 
 class RenderContext(object):
 
     def __init__(self, data, **env):
-        self._data = data
+        self._base = self._data = data
         self._env = env
 
         self._mode = 'strict' if env['strict'] else 'nostrict'
 
-    def update(self, **kwargs):
-        self._data.update(**kwargs)
+    def enter(self, name, value):
+        """see the given variable over the data this context was made with,
+        leaving that data as is."""
+        self._data = Scope(self._base, name, value)
 
     @property
     def data(self):
@@ -82,26 +253,234 @@ class DictStatementPrinter(QueryStatementPrinter):
     def bind(self, key, variable):
         self._bound_variables[key] = variable
 
+class NumericStatementPrinter(QueryStatementPrinter):
+    """binds variables by number, giving the number of the first binding
+    of a key to its later bindings.  a variable bound without a key is
+    always given a number of its own."""
+
+    def __init__(self, buf):
+        super(NumericStatementPrinter, self).__init__(buf)
+        self._bound_variables = []
+        self._numbers = {}
+
+    def bind(self, key, variable):
+        """bind the variable unless its key is bound already, returning its number."""
+        if key is not None:
+            try:
+                return self._numbers[key]
+            except KeyError:
+                pass
+        self._bound_variables.append(variable)
+        number = len(self._bound_variables)
+        if key is not None:
+            self._numbers[key] = number
+        return number
+
+    def push_numbers(self):
+        """number the keys bound from now on afresh, returning the numbers
+        given so far for pop_numbers()."""
+        numbers = self._numbers
+        self._numbers = {}
+        return numbers
+
+    def pop_numbers(self, numbers):
+        self._numbers = numbers
+
+class RowNumericStatementPrinter(NumericStatementPrinter):
+    """binds the variables of one row of a split statement by number, after
+    the given count of variables the statement binds already, giving keys
+    numbered by it their number."""
+
+    def __init__(self, buf, numbers, offset):
+        super(RowNumericStatementPrinter, self).__init__(buf)
+        self._statement_numbers = numbers
+        self._offset = offset
+
+    def bind(self, key, variable):
+        if key is not None:
+            try:
+                return self._statement_numbers[key]
+            except KeyError:
+                pass
+            try:
+                return self._numbers[key]
+            except KeyError:
+                pass
+        self._bound_variables.append(variable)
+        number = self._offset + len(self._bound_variables)
+        if key is not None:
+            self._numbers[key] = number
+        return number
+
+    def push_numbers(self):
+        numbers = (self._statement_numbers, self._numbers)
+        (self._statement_numbers, self._numbers) = ({}, {})
+        return numbers
+
+    def pop_numbers(self, numbers):
+        (self._statement_numbers, self._numbers) = numbers
+
 ITERABLE_DATA_TYPES = (list, tuple, dict)
 
+def get_list_padding(spec):
+    """return the function giving the padded length of a bound list for
+    the given spec, or None if lists are not padded.
+
+    the spec is 'pow2', rounding lengths up to a power of two, a sequence
+    of lengths to round up to, longer lists being left as they are, or such
+    a function itself.
+
+    """
+    if not spec:
+        return None
+    if spec == 'pow2':
+        return _padded_length_pow2
+    if callable(spec):
+        return spec
+    try:
+        buckets = sorted([int(n) for n in spec])
+    except (TypeError, ValueError):
+        raise exc.ArgumentError("Unsupported list padding: %r" % (spec,))
+    if buckets[0] < 1:
+        raise exc.ArgumentError("Unsupported list padding: %r" % (spec,))
+    def padded_length(length):
+        for n in buckets:
+            if length <= n:
+                return n
+        return length
+    return padded_length
+
+def _padded_length_pow2(length):
+    n = 1
+    while n < length:
+        n <<= 1
+    return n
+
+def pad_list(variable, padded_length):
+    """return the items of variable, repeating the last one up to the padded length."""
+    length = len(variable)
+    if padded_length is None or not length:
+        return variable
+    padding = padded_length(length) - length
+    if not padding:
+        return variable
+    variable = list(variable)
+    variable.extend([variable[-1]] * padding)
+    return variable
+
+class ArrayBinding(object):
+    """how a dialect binds a list as a single array parameter."""
+
+    def __init__(self, placeholder, convert):
+        self.placeholder = placeholder
+        self.convert = convert
+
+    def write(self, placeholder):
+        """return the text standing for a list, given the placeholder of its parameter."""
+        return self.placeholder % placeholder
+
+def _json_value(value):
+    """return the JSON encodable value standing for one json cannot encode:
+    dates as sqlite3 binds them, decimals as their exact text, which sqlite
+    compares with numeric columns by value."""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(' ')
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise exc.RenderError("Cant bind %s in a JSON array" % type(value).__name__)
+
+def _json_array(variable):
+    return json.dumps(list(variable), default=_json_value)
+
+ARRAY_BINDINGS = {
+    'postgresql': ArrayBinding('(SELECT unnest(%s))', list),
+    'sqlite': ArrayBinding('(SELECT value FROM json_each(%s))', _json_array),
+}
+
+def get_array_binding(dialect):
+    """return the ArrayBinding of the given dialect name, or None if lists
+    are bound item by item."""
+    if not dialect:
+        return None
+    if isinstance(dialect, ArrayBinding):
+        return dialect
+    try:
+        return ARRAY_BINDINGS[dialect]
+    except (KeyError, TypeError):
+        raise exc.ArgumentError("Unsupported array binds dialect: %r" % (dialect,))
+
+_list_placeholders = {}
+
+def list_placeholders(length, placeholder='?'):
+    """return the placeholders of a bound list of the given length, as '(?, ?)'."""
+    try:
+        return _list_placeholders[(placeholder, length)]
+    except KeyError:
+        placeholders = '(' + ', '.join([placeholder] * length) + ')'
+        if length <= 1024:
+            _list_placeholders[(placeholder, length)] = placeholders
+        return placeholders
+
+def escape_percent(text):
+    """escape the '%' of the given query text for the format and pyformat paramstyles."""
+    return text.replace('%', '%%')
+
 def _resolve_value_in_context_data(ident, data):
-    ident_struct = ident.split('.')
-    if '' in ident_struct:
-        raise KeyError(ident)
-    tmp = data
-    for e in ident_struct:
-        tmp = tmp[e]
-    return tmp
+    return Resolver(ident)(data)
+
+def _node_classes(cls=tree.Node):
+    yield cls
+    for subclass in cls.__subclasses__():
+        for c in _node_classes(subclass):
+            yield c
+
+_dispatch_tables = {}
 
 class RenderListStatement(object):
 
+    parameter_format = 'list'
+    placeholder = '?'
+
     def __init__(self, printer, context, node):
         self.printer = printer
         self.node = node
+        self.dispatch = self.get_dispatch_table(context.mode)
 
         # begin compilation
-        for n in self.node.get_children():
-            n.accept_visitor(self, context)
+        self.walk(node.get_children(), context)
+
+    @classmethod
+    def get_dispatch_table(cls, mode):
+        """return a dict mapping node classes to the functions visiting them
+        in the given mode, built once per visitor class and mode."""
+        try:
+            return _dispatch_tables[(cls, mode)]
+        except KeyError:
+            table = dict([(c, cls.find_visit(c, mode)) for c in _node_classes()])
+            _dispatch_tables[(cls, mode)] = table
+            return table
+
+    @classmethod
+    def find_visit(cls, nodecls, mode):
+        method = getattr(cls, 'visit' + nodecls.__name__ + '_' + mode, None)
+        if method is None:
+            return cls.traverse.im_func
+        return method.im_func
+
+    def walk(self, nodes, context):
+        dispatch = self.dispatch
+        for n in nodes:
+            try:
+                visit = dispatch[n.__class__]
+            except KeyError:
+                # a node class defined after the table was built
+                visit = dispatch[n.__class__] = self.find_visit(n.__class__, context.mode)
+            visit(self, n, context)
+
+    def traverse(self, node, context):
+        self.walk(node.get_children(), context)
 
     def visitLiteral(self, node, context):
         self.printer.write(node.text)
@@ -110,7 +489,7 @@ class RenderListStatement(object):
 
     def visitSubstituteComment_strict(self, node, context):
         try:
-            variable = _resolve_value_in_context_data(node.ident, context.data)
+            variable = node.resolver(context.data)
         except KeyError, e:
             raise exc.RenderError("No variable feeded: '%s'" % node.ident)
         else:
@@ -118,90 +497,149 @@ class RenderListStatement(object):
 
     def visitSubstituteComment_nostrict(self, node, context):
         try:
-            variable = _resolve_value_in_context_data(node.ident, context.data)
+            variable = node.resolver(context.data)
         except KeyError, e:
             return
         else:
             self.write_substitute_comment(node, context, variable)
 
     def write_substitute_comment(self, node, context, variable):
-        if isinstance(variable, ITERABLE_DATA_TYPES):
+        array_binding = context.env.get('array_binding')
+        if isinstance(variable, ITERABLE_DATA_TYPES) and array_binding is not None:
+            self.printer.write(array_binding.write(self.placeholder))
+            self.printer.bind(array_binding.convert(variable))
+        elif isinstance(variable, ITERABLE_DATA_TYPES):
             if not len(variable):
                 raise exc.RenderError("Binding data should not be empty.")
-            self.printer.write('(' + ', '.join(['?' for v in variable]) + ')')
+            variable = pad_list(variable, context.env.get('list_padding'))
+            self.printer.write(list_placeholders(len(variable), self.placeholder))
             for v in variable:
                 self.printer.bind(v)
         else:
-            self.printer.write('?')
+            self.printer.write(self.placeholder)
             self.printer.bind(variable)
 
     def visitEmbed_strict(self, node, context):
-        if node.ident not in context.data:
+        try:
+            variable = node.resolver(context.data)
+        except KeyError, e:
             raise exc.RenderError("No variable feeded: '%s'" % node.ident)
         else:
-            self.write_embed(node, context)
+            self.write_embed(node, context, variable)
 
     def visitEmbed_nostrict(self, node, context):
-        if node.ident in context.data:
-            self.write_embed(node, context)
-
-    def write_embed(self, node, context):
-        variable = context.data[node.ident]
+        try:
+            variable = node.resolver(context.data)
+        except KeyError, e:
+            return
+        else:
+            self.write_embed(node, context, variable)
+
+    def write_embed(self, node, context, variable):
+        """render an embedded template, or its tree, straight into the
+        printer, always strictly; write any other variable as text."""
+        # imported here, the template module depending on this one
+        from sqlshade.template import Template
+        if isinstance(variable, Template):
+            variable = variable.node
         if isinstance(variable, tree.Node):
-            inner_query, inner_bound_variables = compile(variable, '<embedded_node>', context.data,
-                                                         parameter_format=list)
-            self.printer.write(inner_query)
-            for v in inner_bound_variables:
-                self.printer.bind(v)
+            embedded_context = RenderContext(context.data, strict=True,
+                                             list_padding=context.env.get('list_padding'),
+                                             array_binding=context.env.get('array_binding'))
+            dispatch = self.dispatch
+            self.dispatch = self.get_dispatch_table(embedded_context.mode)
+            try:
+                self.walk(variable.get_children(), embedded_context)
+            finally:
+                self.dispatch = dispatch
         else:
-            self.printer.write(variable)
+            self.write_text(variable)
+
+    def write_text(self, text):
+        self.printer.write(text)
 
     def visitIf_strict(self, node, context):
-        if node.ident not in context.data:
+        try:
+            variable = node.resolver(context.data)
+        except KeyError, e:
             raise exc.RenderError("No variable feeded: '%s'" % node.ident)
         else:
-            self.write_if(node, context)
+            self.write_if(node, context, variable)
 
     def visitIf_nostrict(self, node, context):
-        if node.ident in context.data:
-            self.write_if(node, context)
+        try:
+            variable = node.resolver(context.data)
+        except KeyError, e:
+            return
+        else:
+            self.write_if(node, context, variable)
 
-    def write_if(self, node, context):
-        if context.data[node.ident]:
-            for n in node.get_children():
-                n.accept_visitor(self, context)
+    def write_if(self, node, context, variable):
+        if variable:
+            self.walk(node.get_children(), context)
 
     def visitFor_strict(self, node, context):
-        if node.ident not in context.data:
+        try:
+            variable = node.resolver(context.data)
+        except KeyError, e:
             raise exc.RenderError("No variable feeded: '%s'" % node.ident)
         else:
-            self.write_for(node, context)
+            self.write_for(node, context, variable)
 
     def visitFor_nostrict(self, node, context):
-        if node.ident in context.data:
-            self.write_for(node, context)
+        try:
+            variable = node.resolver(context.data)
+        except KeyError, e:
+            return
+        else:
+            self.write_for(node, context, variable)
 
-    def write_for(self, node, context):
+    def write_for(self, node, context, variable):
+        for for_block_context in self.iterate_for(node, context, variable):
+            self.walk(node.get_children(), for_block_context)
+
+    def iterate_for(self, node, context, variable):
+        """yield the context of each iteration of the given for-loop."""
         alias = node.item
-        for_block_context = RenderContext(context.data, strict=context.env['strict'])
-        for iterdata in context.data[node.ident]:
-            for_block_context.update(**{str(alias): iterdata})
-            for n in node.get_children():
-                n.accept_visitor(self, for_block_context)
+        for_block_context = RenderContext(context.data, strict=context.env['strict'],
+                                          list_padding=context.env.get('list_padding'),
+                                          array_binding=context.env.get('array_binding'))
+        for iterdata in variable:
+            for_block_context.enter(str(alias), iterdata)
+            yield for_block_context
 
     def visitTip(self, node, context):
         return
     visitTip_strict = visitTip_nostrict = visitTip
     del visitTip
 
+class LoopSplitMixin(object):
+    """renders a template without its outermost for-loop, recording where
+    the loop stood so that its items can be rendered separately."""
+
+    def __init__(self, printer, context, node):
+        self.loop = None
+        super(LoopSplitMixin, self).__init__(printer, context, node)
+
+    def write_for(self, node, context, variable):
+        if self.loop is not None:
+            return super(LoopSplitMixin, self).write_for(node, context, variable)
+        (query, bound_variables) = self.printer.freeze()
+        self.loop = (node, context, variable, len(query), len(bound_variables))
+
 class RenderDictStatement(RenderListStatement):
 
+    parameter_format = 'dict'
+
     def _escape_object_access(self, ident):
         return ident.replace('.', '__dot__')
 
     def write_substitute_comment(self, node, context, variable):
-        if isinstance(variable, ITERABLE_DATA_TYPES) and not len(variable):
-            raise exc.RenderError("Binding data should not be empty.")
+        array_binding = context.env.get('array_binding')
+        if isinstance(variable, ITERABLE_DATA_TYPES) and array_binding is None:
+            if not len(variable):
+                raise exc.RenderError("Binding data should not be empty.")
+            variable = pad_list(variable, context.env.get('list_padding'))
         if 'for' in context.env:
             for_env = context.env['for']
             alias = for_env['alias']
@@ -213,36 +651,121 @@ class RenderDictStatement(RenderListStatement):
             ident = node.ident
         if '.' in ident:
             ident = self._escape_object_access(ident)
-        if isinstance(variable, ITERABLE_DATA_TYPES):
-            idents = []
+        if isinstance(variable, ITERABLE_DATA_TYPES) and array_binding is not None:
+            self.printer.write(array_binding.write(self.bind(ident, array_binding.convert(variable))))
+        elif isinstance(variable, ITERABLE_DATA_TYPES):
+            placeholders = []
             for i, v in enumerate(variable):
-                ident_curr = ident + '_' + str(i+1)
-                idents.append(':' + ident_curr)
-                self.printer.bind(ident_curr, v)
-            self.printer.write('(' + ', '.join(idents) + ')')
+                placeholders.append(self.bind(ident + '_' + str(i+1), v))
+            self.printer.write('(' + ', '.join(placeholders) + ')')
         else:
-            self.printer.write(':' + ident)
-            self.printer.bind(ident, variable)
+            self.printer.write(self.bind(ident, variable))
 
-    def write_embed(self, node, context):
-        variable = context.data[node.ident]
-        if isinstance(variable, tree.Node):
-            inner_query, inner_bound_variables = compile(variable, '<embedded_node>', context.data,
-                                                         parameter_format=dict)
-            self.printer.write(inner_query)
-            for ident, v in inner_bound_variables.iteritems():
-                self.printer.bind(ident, v)
-        else:
-            self.printer.write(variable)
+    def bind(self, ident, variable):
+        """bind the variable under the given name, returning its placeholder."""
+        self.printer.bind(ident, variable)
+        return ':' + ident
 
 
-    def write_for(self, node, context):
+    def iterate_for(self, node, context, variable):
         alias = node.item
-        for_env = dict(alias=alias)
-        for_block_context = RenderContext(context.data, strict=context.env['strict'])
+        # the aliases of the enclosing loops as well
+        aliases = context.env.get('for', {}).get('aliases', ()) + (alias,)
+        for_env = dict(alias=alias, aliases=aliases)
+        for_block_context = RenderContext(context.data, strict=context.env['strict'],
+                                          list_padding=context.env.get('list_padding'),
+                                          array_binding=context.env.get('array_binding'))
         for_block_context.env['for'] = for_env
-        for i, iterdata in enumerate(context.data[node.ident]):
-            for_block_context.update(**{str(alias): iterdata})
+        for i, iterdata in enumerate(variable):
+            for_block_context.enter(str(alias), iterdata)
             for_env['count'] = i + 1
-            for n in node.get_children():
-                n.accept_visitor(self, for_block_context)
+            yield for_block_context
+
+class PercentEscapeMixin(object):
+    """escapes the '%' of the query text, for the format and pyformat paramstyles."""
+
+    def visitLiteral(self, node, context):
+        self.printer.write(escape_percent(node.text))
+    visitLiteral_strict = visitLiteral_nostrict = visitLiteral
+    del visitLiteral
+
+    def write_text(self, text):
+        self.printer.write(escape_percent(text))
+
+class RenderFormatStatement(PercentEscapeMixin, RenderListStatement):
+    """binds variables as '%s'."""
+
+    parameter_format = 'format'
+    placeholder = '%s'
+
+class RenderPyformatStatement(PercentEscapeMixin, RenderDictStatement):
+    """binds variables as '%(name)s'."""
+
+    parameter_format = 'pyformat'
+
+    def bind(self, ident, variable):
+        self.printer.bind(ident, variable)
+        return '%(' + ident + ')s'
+
+class RenderNumericStatement(RenderDictStatement):
+    """binds variables as '$1', giving repeated names the same number,
+    including those of embedded templates.
+
+    the names of the items of for-loops are not unique across the loops,
+    so their variables are always given numbers of their own, as are those
+    of templates embedded in a loop past that template.
+
+    """
+
+    parameter_format = 'numeric'
+
+    # whether the variable bound is the item of an enclosing for-loop
+    in_loop_item = False
+
+    def write_substitute_comment(self, node, context, variable):
+        aliases = context.env.get('for', {}).get('aliases', ())
+        self.in_loop_item = node.ident.split('.')[0] in aliases
+        super(RenderNumericStatement, self).write_substitute_comment(node, context, variable)
+
+    def write_embed(self, node, context, variable):
+        if 'for' not in context.env:
+            return super(RenderNumericStatement, self).write_embed(node, context, variable)
+        numbers = self.printer.push_numbers()
+        try:
+            super(RenderNumericStatement, self).write_embed(node, context, variable)
+        finally:
+            self.printer.pop_numbers(numbers)
+
+    def bind(self, ident, variable):
+        if self.in_loop_item:
+            ident = None
+        return '$%d' % self.printer.bind(ident, variable)
+
+class SplitListStatement(LoopSplitMixin, RenderListStatement):
+    pass
+
+class SplitDictStatement(LoopSplitMixin, RenderDictStatement):
+    pass
+
+class SplitFormatStatement(LoopSplitMixin, RenderFormatStatement):
+    pass
+
+class SplitPyformatStatement(LoopSplitMixin, RenderPyformatStatement):
+    pass
+
+class SplitNumericStatement(LoopSplitMixin, RenderNumericStatement):
+    pass
+
+CHUNK_FACTORY = {
+    'list': (RenderListStatement, SplitListStatement, ListStatementPrinter),
+    'dict': (RenderDictStatement, SplitDictStatement, DictStatementPrinter),
+
+    list: (RenderListStatement, SplitListStatement, ListStatementPrinter),
+    dict: (RenderDictStatement, SplitDictStatement, DictStatementPrinter),
+
+    'qmark': (RenderListStatement, SplitListStatement, ListStatementPrinter),
+    'named': (RenderDictStatement, SplitDictStatement, DictStatementPrinter),
+    'format': (RenderFormatStatement, SplitFormatStatement, ListStatementPrinter),
+    'pyformat': (RenderPyformatStatement, SplitPyformatStatement, DictStatementPrinter),
+    'numeric': (RenderNumericStatement, SplitNumericStatement, NumericStatementPrinter),
+}
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""records runtime statistics of the templates rendered, per template uri.
+
+recording is off until enable() is called; until then rendering only
+checks the module flag.  snapshot() returns the statistics gathered so far.
+
+no lock is taken while recording, so threads rendering the same template
+at once may now and then lose an update of its counters.
+
+"""
+
+import bisect
+import timeit
+
+# the upper bounds, in seconds, of the buckets of the render time histogram:
+# powers of two from 1us to about 16s, then one bucket for anything longer
+BUCKET_BOUNDS = [2 ** n / 1e6 for n in range(25)]
+
+# the distinct queries counted per template at most
+MAX_SHAPES = 1000
+
+enabled = False
+
+_clock = timeit.default_timer
+_registry = {}
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def reset():
+    """discard the statistics gathered so far."""
+    _registry.clear()
+
+def get_stats(uri):
+    """return the TemplateStats of the given uri, creating it if needed."""
+    try:
+        return _registry[uri]
+    except KeyError:
+        return _registry.setdefault(uri, TemplateStats(uri))
+
+def record(uri, render, context):
+    """call render with context, recording the time taken and the result
+    under the given uri."""
+    start = _clock()
+    result = render(context)
+    get_stats(uri).add(_clock() - start, result)
+    return result
+
+def instrument(uri, render):
+    """return a function calling render like record() does."""
+    stats = get_stats(uri)
+    def instrumented(context):
+        start = _clock()
+        result = render(context)
+        stats.add(_clock() - start, result)
+        return result
+    return instrumented
+
+def snapshot():
+    """return a dict mapping the uri of every template rendered to a dict
+    of its statistics."""
+    return dict([(uri, stats.snapshot()) for (uri, stats) in _registry.items()])
+
+class TemplateStats(object):
+    """the statistics of one template."""
+
+    __slots__ = ('uri', 'count', 'total_time', 'max_time', 'histogram',
+                 'total_params', 'max_params', 'total_length', 'max_length', 'shapes')
+
+    def __init__(self, uri):
+        self.uri = uri
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.histogram = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.total_params = 0
+        self.max_params = 0
+        self.total_length = 0
+        self.max_length = 0
+        self.shapes = set()
+
+    def add(self, elapsed, result):
+        (query, bound_variables) = result
+        (params, length) = (len(bound_variables), len(query))
+        self.count += 1
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        self.histogram[bisect.bisect_left(BUCKET_BOUNDS, elapsed)] += 1
+        self.total_params += params
+        if params > self.max_params:
+            self.max_params = params
+        self.total_length += length
+        if length > self.max_length:
+            self.max_length = length
+        if len(self.shapes) < MAX_SHAPES:
+            self.shapes.add(hash(query))
+
+    def percentile(self, p):
+        """return an upper estimate of the render time below which the given
+        percentage of renders fall, from the histogram."""
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100.0
+        seen = 0
+        for (i, n) in enumerate(self.histogram):
+            seen += n
+            if n and seen >= rank:
+                if i < len(BUCKET_BOUNDS):
+                    return min(BUCKET_BOUNDS[i], self.max_time)
+                break
+        return self.max_time
+
+    def snapshot(self):
+        count = self.count or 1
+        return {
+            'count': self.count,
+            'total_time': self.total_time,
+            'mean_time': self.total_time / count,
+            'max_time': self.max_time,
+            'p50_time': self.percentile(50),
+            'p90_time': self.percentile(90),
+            'p99_time': self.percentile(99),
+            'histogram': list(zip(BUCKET_BOUNDS + [None], self.histogram)),
+            'mean_params': float(self.total_params) / count,
+            'max_params': self.max_params,
+            'mean_sql_length': float(self.total_length) / count,
+            'max_sql_length': self.max_length,
+            'shapes': len(self.shapes),
+        }
@@ -1,11 +1,21 @@
 # -*- coding: utf-8 -*-
+import os
 import re
-import copy
+import mmap
+import threading
 
-from sqlshade.lexer import Lexer
-from sqlshade import exc, sqlgen
+from sqlshade.lexer import Lexer, detect_encoding, decode_source
+from sqlshade import exc, codegen, sqlgen, stats, tree
+from sqlshade.cache import CompileCache
 
 class Template(object):
+    """a compiled template.
+
+    with lazy, the text is only kept until the template is first rendered,
+    or compile() is called, and is compiled then; errors in it are raised
+    at that point.
+
+    """
 
     def __init__(self,
                  text=None,
@@ -14,46 +24,253 @@ class Template(object):
                  output_encoding=None,
                  disable_unicode=False,
                  strict=True,
-                 parameter_format='list'):
+                 parameter_format='list',
+                 uri=None,
+                 cache_dir=None,
+                 list_padding=None,
+                 array_binds=None,
+                 lookup=None,
+                 lazy=False):
         if filename:
             self.module_id = re.sub(r'\W', '_', filename)
             self.uri = filename
         else:
             self.module_id = "memory:" + hex(id(self))
             self.uri = self.module_id
+        if uri is not None:
+            self.uri = uri
 
         self.input_encoding = input_encoding
         self.output_encoding = output_encoding
         self.disable_unicode = disable_unicode
         self.strict = strict
         self.parameter_format = parameter_format
+        self.cache_dir = cache_dir
+        self.list_padding = list_padding
+        self.array_binds = array_binds
+        self.lookup = lookup
+        self.filename = filename
 
-        if text is not None:
-            node = _compile_text(self, text, filename)
-            self.node = node
-        else:
+        if text is None:
             raise exc.RenderError("Template requires text or filename")
+        self._text = text
+        if not lazy:
+            self.compile()
 
-        self.filename = filename
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """return a Template of the file at the given path, taking the
+        arguments of Template otherwise.
+
+        the file is read at once, or memory-mapped when larger than
+        MMAP_THRESHOLD, and decoded straight from the bytes read along its
+        BOM or magic encoding comment.  the path is the filename of the
+        template, naming it in errors and keying it in the compile cache.
+
+        """
+        text = _read_file(path, kwargs.get('input_encoding'), kwargs.get('disable_unicode'))
+        return cls(text, filename=path, **kwargs)
+
+    def compile(self):
+        """compile the template unless it is compiled already, returning it.
+
+        no lock is held while compiling, so threads rendering a lazy template
+        at once may each compile it; the first to finish publishes its result.
+
+        """
+        text = self._text
+        if text is None:
+            return self
+        node = _compile_text(self, text, self.filename)
+        # the uri and Template of each template included directly
+        includes = _link_includes(self, node)
+        callable_ = codegen.get_renderer(node, self.parameter_format, self.strict,
+                                         self.list_padding, self.array_binds)
+        _publish_mutex.acquire()
+        try:
+            if self._text is not None:
+                self.includes = includes
+                self.callable_ = callable_
+                self.node = node
+                self._text = None
+        finally:
+            _publish_mutex.release()
+        return self
+
+    def __getattr__(self, name):
+        # only called for missing attributes: those set by compile()
+        if name in _compiled_attributes and self.__dict__.get('_text') is not None:
+            self.compile()
+            return getattr(self, name)
+        raise AttributeError(name)
 
     def render(self, **context):
-        running_context = copy.copy(context)
-        for key in running_context:
-            value = running_context[key]
-            if hasattr(value, 'node'):
-                running_context[key] = value.node
-        return sqlgen.compile(self.node, self.filename, running_context,
-                              source_encoding=self.input_encoding,
-                              generate_unicode=self.disable_unicode is False,
-                              strict=self.strict,
-                              parameter_format=self.parameter_format
-                              )
+        if stats.enabled:
+            return stats.record(self.uri, self.callable_, context)
+        return self.callable_(context)
+
+    def get_render_function(self):
+        """return the function taking a context and rendering the template,
+        recording statistics while those are enabled."""
+        if stats.enabled:
+            return stats.instrument(self.uri, self.callable_)
+        return self.callable_
+
+    def render_stream(self, chunk_size=None, **context):
+        """render the template as a generator, yielding the query in chunks
+        each with its own bound variables, as the for-loops of the template
+        run.
+
+        joining the chunks of the query and concatenating, or for the dict
+        parameter format merging, their bound variables gives the result
+        of render().  a for-loop may run over any iterable, which is
+        consumed lazily.  chunk_size is the number of query fragments
+        collected before a chunk is yielded.
+
+        """
+        render = codegen.get_renderer(self.node, self.parameter_format, self.strict,
+                                      self.list_padding, self.array_binds, stream=True)
+        if chunk_size is None:
+            return render(context)
+        return render(context, chunk_size)
+
+    def render_chunks(self, max_params=None, max_size=None, **context):
+        """render the template as one or more complete statements of at
+        most max_params bound variables and max_size characters each,
+        yielding the query and bound variables of every statement.
+
+        the items of the outermost for-loop are split among the statements,
+        which all repeat the rest of the template, as for a bulk insert
+        under the limit of bound variables of a driver.  see
+        sqlgen.compile_chunks.
+
+        """
+        return sqlgen.compile_chunks(self.node, self.filename, context,
+                                     max_params=max_params,
+                                     max_size=max_size,
+                                     strict=self.strict,
+                                     parameter_format=self.parameter_format,
+                                     list_padding=self.list_padding,
+                                     array_binds=self.array_binds)
+
+    def render_many(self, contexts):
+        """render the template once per context in the given iterable,
+        yielding the query and bound variables of each."""
+        render = self.get_render_function()
+        for context in contexts:
+            yield render(context)
+
+    def render_executemany(self, contexts):
+        """render the template once per context in the given iterable,
+        returning the query along with the list of their bound variables,
+        as taken by cursor.executemany().
+
+        every context must render to the same query, else RenderError is
+        raised.  the query is None when there is no context.
+
+        """
+        render = self.get_render_function()
+        query = None
+        rows = []
+        for context in contexts:
+            (curr_query, bound_variables) = render(context)
+            if query is None:
+                query = curr_query
+            elif curr_query != query:
+                raise exc.RenderError("Contexts render to different queries: context %d" % len(rows))
+            rows.append(bound_variables)
+        return query, rows
+
+# the size from which Template.from_file maps files into memory rather than reading them
+MMAP_THRESHOLD = 1024 * 1024
+
+def _read_file(path, input_encoding=None, disable_unicode=False):
+    f = open(path, 'rb')
+    try:
+        size = os.fstat(f.fileno()).st_size
+        if disable_unicode or not size or size < MMAP_THRESHOLD:
+            return f.read()
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (offset, encoding) = detect_encoding(mapping, path)
+            return decode_source(mapping, offset, encoding or input_encoding, path)
+        finally:
+            mapping.close()
+    finally:
+        f.close()
+
+_compiled_attributes = frozenset(['node', 'callable_', 'includes'])
+
+# held only while a compiled template is published, never while compiling
+_publish_mutex = threading.Lock()
+
+def warm(templates):
+    """compile every lazy Template among the given objects, such as the
+    values of a module declaring templates."""
+    for template in templates:
+        if isinstance(template, Template):
+            template.compile()
+
+_linking = threading.local()
+
+def _link_includes(template, node):
+    """splice the trees of the templates included under node in place of
+    their include controls, returning the uri and Template of each, raising
+    CompileError on an include cycle."""
+    stack = getattr(_linking, 'stack', None)
+    if stack is None:
+        stack = _linking.stack = []
+    includes = []
+    stack.append(template.uri)
+    try:
+        _splice_includes(template, node, stack, includes)
+    finally:
+        stack.pop()
+    return includes
+
+def _splice_includes(template, node, stack, includes):
+    children = []
+    for n in node.get_children():
+        if isinstance(n, tree.Include):
+            (uri, included) = _included_template(template, n, stack)
+            includes.append((uri, included))
+            children.extend(included.node.get_children())
+        else:
+            if isinstance(n, tree.ControlComment):
+                _splice_includes(template, n, stack, includes)
+            children.append(n)
+    node.nodes[:] = children
+
+def _included_template(template, node, stack):
+    lookup = template.lookup
+    if lookup is None:
+        raise exc.CompileError("Cant include '%s' without a template lookup" % node.name,
+                               **node.exception_kwargs)
+    try:
+        uri = lookup.adjust_uri(node.name)
+        if uri in stack:
+            raise exc.CompileError("Cyclic include of '%s'" % uri, **node.exception_kwargs)
+        included = lookup.get_template(uri)
+    except exc.TemplateLookupError, e:
+        raise exc.CompileError("Cant locate included template '%s'" % node.name,
+                               **node.exception_kwargs)
+    return (uri, included)
 
 def _compile_text(template, text, filename):
-    id = template.module_id
+    if template.cache_dir is not None:
+        cache = CompileCache(template.cache_dir)
+        key = cache.key(text, filename,
+            disable_unicode=template.disable_unicode,
+            input_encoding=template.input_encoding
+        )
+        node = cache.get(key)
+        if node is not None:
+            return node
     lexer = Lexer(text, filename,
         disable_unicode=template.disable_unicode,
         input_encoding=template.input_encoding
     )
     node = lexer.parse()
+    if template.cache_dir is not None:
+        cache.put(key, node)
     return node
@@ -0,0 +1,107 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from sqlshade import tree
+from sqlshade.cache import CompileCache
+from sqlshade.lexer import Lexer
+from sqlshade.template import Template
+
+class CompileCacheTest(unittest.TestCase):
+
+    text = """SELECT * FROM t_member WHERE TRUE
+        /*#if use_status*/AND status IN /*:status*/(1, 2)/*#/if*/
+        /*#for item in items*/OR id = /*:item.id*/1/*#/for*/
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = CompileCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_store_and_load(self):
+        key = self.cache.key(self.text, 'member.sql')
+        assert self.cache.get(key) is None
+        self.cache.put(key, Lexer(self.text, 'member.sql').parse())
+
+        node = self.cache.get(key)
+        assert isinstance(node, tree.TemplateNode)
+        assert isinstance(node.nodes[1], tree.If)
+        assert isinstance(node.nodes[3], tree.For)
+        assert node.nodes[3].item == 'item'
+        assert repr(node) == repr(Lexer(self.text, 'member.sql').parse())
+        assert os.listdir(self.directory) == [key + '.pickle']
+
+    def test_key(self):
+        key = self.cache.key(self.text, 'member.sql')
+        assert key == self.cache.key(self.text, 'member.sql')
+        assert key == self.cache.key(self.text.encode('utf-8'), 'member.sql')
+        assert key != self.cache.key(self.text + ' ', 'member.sql')
+        assert key != self.cache.key(self.text, 'another.sql')
+        assert key != self.cache.key(self.text, 'member.sql', disable_unicode=True)
+
+    def test_corrupt_entry(self):
+        key = self.cache.key(self.text)
+        f = open(self.cache.path(key), 'wb')
+        f.write('not a pickle')
+        f.close()
+        assert self.cache.get(key) is None
+        assert not os.path.exists(self.cache.path(key))
+
+    def test_stale_entry(self):
+        key = self.cache.key(self.text)
+        another_key = self.cache.key('SELECT 1')
+        self.cache.put(another_key, Lexer('SELECT 1').parse())
+        os.rename(self.cache.path(another_key), self.cache.path(key))
+        assert self.cache.get(key) is None
+
+    def test_template(self):
+        template = Template(self.text, cache_dir=self.directory)
+        assert len(os.listdir(self.directory)) == 1
+        cached = Template(self.text, cache_dir=self.directory)
+        assert len(os.listdir(self.directory)) == 1
+        assert repr(cached.node) == repr(template.node)
+
+        context = dict(use_status=True, status=[1, 3], items=[dict(id=1), dict(id=2)])
+        assert cached.render(**context) == template.render(**context)
+
+    def test_template_ignores_older_tree_format(self):
+        from sqlshade import cache
+        # a tree pickled by a sqlshade whose For nodes lacked an attribute
+        key = self.cache.key(self.text, None, disable_unicode=False, input_encoding=None)
+        node = Lexer(self.text).parse()
+        del node.nodes[3].item
+        self.cache.put(key, node)
+
+        format = cache.TREE_FORMAT
+        cache.TREE_FORMAT += 1
+        try:
+            template = Template(self.text, cache_dir=self.directory)
+            context = dict(use_status=False, items=[dict(id=1)])
+            assert template.render(**context) == Template(self.text).render(**context)
+            assert len(os.listdir(self.directory)) == 2
+        finally:
+            cache.TREE_FORMAT = format
+
+    def test_tree_format(self):
+        from sqlshade import cache
+        key = self.cache.key(self.text)
+        self.cache.put(key, Lexer(self.text).parse())
+        format = cache.TREE_FORMAT
+        cache.TREE_FORMAT += 1
+        try:
+            assert self.cache.key(self.text) != key
+            assert self.cache.get(key) is None
+        finally:
+            cache.TREE_FORMAT = format
+
+    def test_unusable_directory(self):
+        path = os.path.join(self.directory, 'notadir')
+        open(path, 'w').close()
+        cache = CompileCache(path)
+        cache.put(cache.key('SELECT 1'), Lexer('SELECT 1').parse())
+        assert cache.get(cache.key('SELECT 1')) is None
+        assert Template('SELECT 1', cache_dir=path).render() == ('SELECT 1', [])
@@ -0,0 +1,289 @@
+import unittest
+import copy
+
+from sqlshade import codegen, sqlgen, exc
+from sqlshade.lexer import Lexer
+
+def parse(text):
+    return Lexer(text).parse()
+
+class RenderFunctionTest(unittest.TestCase):
+
+    templates = [
+        """SELECT * FROM t_member /* comment */ WHERE id = /*:id*/1 -- line comment
+        """,
+        """SELECT * FROM t_member WHERE id IN /*:ids*/(1, 2) AND name = /*:item.name*/'kjim'""",
+        """SELECT * FROM t_member WHERE TRUE
+            /*#if use_status*/AND status = /*:status*/1/*#/if*/
+            /*#tip*/AND debug = 1/*#/tip*/
+        """,
+        """SELECT * FROM t_member WHERE FALSE
+            /*#for item in items*/
+            OR (id = /*:item.id*/1 AND status IN /*:item.status*/(1, 2) AND kind = /*:kind*/'a')
+            /*#/for*/
+        """,
+        """SELECT * FROM t_member WHERE FALSE
+            /*#for group in groups*/
+            /*#for member in members*/
+            OR (member = /*:member*/1 AND group = /*:group*/1)
+            /*#/for*/
+            /*#/for*/
+        """,
+        """SELECT * FROM /*#embed table_name*/t_member/*#/embed*/ WHERE id = /*:id*/1""",
+    ]
+
+    contexts = [
+        dict(id=1, ids=[1, 2, 3], item=dict(name='keiji'), use_status=True, status=2,
+             items=[dict(id=1, status=[1, 2]), dict(id=2, status=(3,))], kind='k',
+             groups=['a', 'b'], members=[10, 20], table_name='t_member_AB'),
+        dict(id=2, ids=(4,), item=dict(name='kjim'), use_status=False,
+             items=[], kind='k', groups=[], members=[], table_name='t_member_CD'),
+        dict(),
+    ]
+
+    def assert_same_rendering(self, text, data, parameter_format, strict):
+        node = parse(text)
+        try:
+            expected = sqlgen.compile(node, None, copy.deepcopy(data),
+                                      strict=strict, parameter_format=parameter_format)
+        except exc.RenderError:
+            self.assertRaises(exc.RenderError,
+                              codegen.compile_renderer(node, parameter_format, strict),
+                              copy.deepcopy(data))
+        else:
+            rendered = codegen.compile_renderer(node, parameter_format, strict)(copy.deepcopy(data))
+            assert rendered == expected, (rendered, expected)
+
+    def test_same_as_sqlgen(self):
+        for text in self.templates:
+            for data in self.contexts:
+                for parameter_format in ('list', 'dict', 'format', 'pyformat', 'numeric'):
+                    for strict in (True, False):
+                        self.assert_same_rendering(text, data, parameter_format, strict)
+
+    def test_same_as_sqlgen_with_list_padding(self):
+        for text in self.templates:
+            for data in self.contexts:
+                for parameter_format in ('list', 'dict'):
+                    for list_padding in ('pow2', [3, 8]):
+                        node = parse(text)
+                        try:
+                            expected = sqlgen.compile(node, None, copy.deepcopy(data),
+                                                      parameter_format=parameter_format,
+                                                      list_padding=list_padding)
+                        except exc.RenderError:
+                            continue
+                        render = codegen.compile_renderer(node, parameter_format, list_padding=list_padding)
+                        assert render(copy.deepcopy(data)) == expected
+
+    def test_same_as_sqlgen_with_array_binds(self):
+        for text in self.templates:
+            for data in self.contexts:
+                for parameter_format in ('list', 'dict'):
+                    node = parse(text)
+                    try:
+                        expected = sqlgen.compile(node, None, copy.deepcopy(data),
+                                                  parameter_format=parameter_format,
+                                                  array_binds='postgresql')
+                    except exc.RenderError:
+                        continue
+                    render = codegen.compile_renderer(node, parameter_format, array_binds='postgresql')
+                    assert render(copy.deepcopy(data)) == expected
+
+    def test_embed_another_node(self):
+        node = parse("SELECT * FROM t_member WHERE /*#embed where_clause*/TRUE/*#/embed*/")
+        where_clause = parse("status = /*:status*/1")
+        data = dict(where_clause=where_clause, status=3)
+        assert codegen.compile_renderer(node, 'list')(dict(data)) == \
+            ("SELECT * FROM t_member WHERE status = ?", [3])
+        assert codegen.compile_renderer(node, 'dict')(dict(data)) == \
+            ("SELECT * FROM t_member WHERE status = :status", {'status': 3})
+
+    def test_generated_source_is_straight_line(self):
+        source = codegen.generate_source(parse("SELECT /*:a*/1, /*:b*/2 FROM t_member"), 'list')
+        assert 'accept_visitor' not in source
+        assert "_w(u'SELECT ')" in source
+        render_source = source.split('def _gather(')[0]
+        assert render_source.count("_w('?')") == 2
+
+    def test_literals_are_joined(self):
+        source = codegen.generate_source(parse("SELECT 1 /* comment */ FROM /*#tip*/x/*#/tip*/t_member"))
+        assert "_w(u'SELECT 1  FROM t_member')" in source
+
+    def test_renderer_is_cached_per_node(self):
+        node = parse("SELECT /*:a*/1")
+        assert codegen.get_renderer(node, 'list') is codegen.get_renderer(node, list)
+        assert codegen.get_renderer(node, 'list') is not codegen.get_renderer(node, 'dict')
+        assert codegen.get_renderer(node, 'list', True) is not codegen.get_renderer(node, 'list', False)
+
+    def test_dotted_identifiers(self):
+        class Filter(object):
+            enabled = True
+            ids = [1, 2]
+            name = 'kjim'
+        text = """SELECT * FROM t_member WHERE name = /*:filter.name*/'a'
+            /*#if filter.enabled*//*#for id in filter.ids*/OR id = /*:id*/1/*#/for*//*#/if*/"""
+        source = codegen.generate_source(parse(text), 'list')
+        assert "_r1(data)" in source
+        for data in (dict(filter=Filter()), dict(filter=dict(name='a', enabled=False, ids=[])), dict()):
+            for parameter_format in ('list', 'dict'):
+                for strict in (True, False):
+                    self.assert_same_rendering(text, data, parameter_format, strict)
+
+    def test_numeric_embedded_node(self):
+        node = parse("SELECT * FROM t_member WHERE id = /*:id*/1 AND /*#embed where_clause*/TRUE/*#/embed*/")
+        where_clause = parse("status IN /*:status*/(1) AND id <> /*:id*/2")
+        render = codegen.compile_renderer(node, 'numeric')
+        data = dict(id=1, status=[2, 3], where_clause=where_clause)
+        for i in range(2):
+            assert render(data) == \
+                ("SELECT * FROM t_member WHERE id = $1 AND status IN ($2, $3) AND id <> $1", [1, 2, 3])
+        assert render(data) == sqlgen.compile(node, None, data, parameter_format='numeric')
+
+    def test_nested_embedded_nodes(self):
+        node = parse("SELECT * FROM t_member WHERE /*#embed where_clause*/TRUE/*#/embed*/")
+        where_clause = parse("id = /*:id*/1 AND /*#embed condition*/TRUE/*#/embed*/")
+        condition = parse("""/*#for status in statuses*/status = /*:status*/1 OR /*#/for*/
+            kind IN /*:kinds*/(1) AND /*#embed flag*/TRUE/*#/embed*/""")
+        for flag in ("flag = 1", parse("id <> /*:id*/2")):
+            data = dict(id=1, statuses=[2, 3], kinds=['a', 'b'], flag=flag,
+                        condition=condition, where_clause=where_clause)
+            for parameter_format in ('list', 'dict', 'format', 'pyformat', 'numeric'):
+                expected = sqlgen.compile(node, None, data, parameter_format=parameter_format)
+                render = codegen.compile_renderer(node, parameter_format)
+                for i in range(2):
+                    assert render(data) == expected, (render(data), expected)
+                chunks = list(codegen.compile_renderer(node, parameter_format, stream=True)(data, 1))
+                assert ''.join([q for (q, b) in chunks]) == expected[0]
+
+    def test_numeric_stream(self):
+        node = parse("SELECT /*:a*/1 /*#for i in items*/, /*:i*/2, /*:a*/3/*#/for*/")
+        render = codegen.compile_renderer(node, 'numeric', stream=True)
+        chunks = list(render(dict(a=0, items=[1, 2, 3]), 6))
+        assert chunks == [("SELECT $1 , $2, $1", [0, 1]), (", $3, $4, $5, $4", [2, 0, 3])]
+
+    def test_unsupported_parameter_format(self):
+        self.assertRaises(exc.ArgumentError, codegen.generate_source, parse("SELECT 1"), 'tuple')
+
+class ConstantShapeTest(unittest.TestCase):
+
+    text = """SELECT * FROM t_member /* comment */
+        WHERE id = /*:id*/1 AND name = /*:item.name*/'kjim' AND id <> /*:id*/2
+        /*#tip*/ORDER BY id/*#/tip*/"""
+
+    def test_query_is_built_at_compile_time(self):
+        source = codegen.generate_source(parse(self.text), 'list')
+        assert 'def _render(data):' in source
+        assert "_sql = u'SELECT * FROM t_member \\n        WHERE id = ? AND name = ? AND id <> ?\\n        '" in source
+
+    def test_render_scalar_variables(self):
+        node = parse(self.text)
+        data = dict(id=3, item=dict(name='keiji'))
+        query, bound_variables = codegen.compile_renderer(node, 'list')(data)
+        assert query == """SELECT * FROM t_member \n        WHERE id = ? AND name = ? AND id <> ?\n        """
+        assert bound_variables == [3, 'keiji', 3]
+
+        query, bound_variables = codegen.compile_renderer(node, 'dict')(data)
+        assert query == """SELECT * FROM t_member \n        WHERE id = :id AND name = :item__dot__name AND id <> :id\n        """
+        assert bound_variables == {'id': 3, 'item__dot__name': 'keiji'}
+
+    def test_fallback_on_list_variables(self):
+        node = parse(self.text)
+        data = dict(id=[3, 4], item=dict(name='keiji'))
+        query, bound_variables = codegen.compile_renderer(node, 'list')(data)
+        assert 'WHERE id = (?, ?) AND name = ? AND id <> (?, ?)' in query
+        assert bound_variables == [3, 4, 'keiji', 3, 4]
+
+        query, bound_variables = codegen.compile_renderer(node, 'dict')(data)
+        assert 'WHERE id = (:id_1, :id_2) AND name = :item__dot__name' in query
+        assert bound_variables == {'id_1': 3, 'id_2': 4, 'item__dot__name': 'keiji'}
+
+    def test_fallback_on_missing_variables(self):
+        node = parse(self.text)
+        self.assertRaises(exc.RenderError, codegen.compile_renderer(node, 'list'), dict(id=1))
+
+        query, bound_variables = codegen.compile_renderer(node, 'list', strict=False)(dict(id=1))
+        assert 'WHERE id = ? AND name =  AND id <> ?' in query
+        assert bound_variables == [1, 1]
+
+    def test_controls_disable_constant_shape(self):
+        source = codegen.generate_source(parse("SELECT 1 /*#if a*/, /*:b*/2/*#/if*/"))
+        assert 'render = _shaped' in source
+        assert 'def render' not in source
+
+    def test_literal_only(self):
+        render = codegen.compile_renderer(parse("SELECT 1"), 'list')
+        (query, bound_variables) = render({})
+        assert query == "SELECT 1"
+        assert bound_variables == []
+        bound_variables.append(1)
+        assert render({}) == ("SELECT 1", [])
+
+class ShapeCacheTest(unittest.TestCase):
+
+    text = """SELECT * FROM t_member WHERE FALSE
+        /*#if use_status*/OR status IN /*:status*/(1, 2)/*#/if*/
+        /*#for item in items*/OR id = /*:item.id*/1/*#/for*/"""
+
+    def shapes_of(self, render):
+        return render.func_globals['_shapes']
+
+    def test_query_is_reused_per_shape(self):
+        render = codegen.compile_renderer(parse(self.text), 'list')
+        (query1, bound_variables) = render(dict(use_status=True, status=[1, 2], items=[dict(id=3)]))
+        assert bound_variables == [1, 2, 3]
+        (query2, bound_variables) = render(dict(use_status=True, status=[4, 5], items=[dict(id=6)]))
+        assert bound_variables == [4, 5, 6]
+        assert query1 is query2
+        assert len(self.shapes_of(render)) == 1
+
+        (query3, bound_variables) = render(dict(use_status=True, status=[4], items=[dict(id=6)]))
+        assert 'status IN (?)' in query3
+        (query4, bound_variables) = render(dict(use_status=False, items=[dict(id=6), dict(id=7)]))
+        assert 'status' not in query4
+        assert query4.count('OR id = ?') == 2
+        assert bound_variables == [6, 7]
+        assert len(self.shapes_of(render)) == 3
+
+    def test_dict_parameters(self):
+        render = codegen.compile_renderer(parse(self.text), 'dict')
+        for i in range(2):
+            (query, bound_variables) = render(dict(use_status=True, status=[i], items=[dict(id=i), dict(id=i+1)]))
+            assert 'OR status IN (:status_1)' in query
+            assert 'OR id = :item__dot__id_1' in query and 'OR id = :item__dot__id_2' in query
+            assert bound_variables == dict(status_1=i, item__dot__id_1=i, item__dot__id_2=i+1)
+        assert len(self.shapes_of(render)) == 1
+
+    def test_missing_and_present_variables_differ(self):
+        render = codegen.compile_renderer(parse("SELECT /*:a*/1, /*:b*/2"), 'list', strict=False)
+        assert render(dict(a=1)) == ("SELECT ?, ", [1])
+        assert render(dict(b=2)) == ("SELECT , ?", [2])
+        assert render(dict(a=1, b=2)) == ("SELECT ?, ?", [1, 2])
+
+    def test_item_assigned_by_loop(self):
+        text = "SELECT /*:item*/1 /*#for item in items*/, /*:item*/2/*#/for*/"
+        render = codegen.compile_renderer(parse(text), 'list')
+        data = dict(item=0, items=[1, 2])
+        assert render(data) == ("SELECT ? , ?, ?", [0, 1, 2])
+        data = dict(item=0, items=[3, 4])
+        assert render(data) == ("SELECT ? , ?, ?", [0, 3, 4])
+
+    def test_cache_is_bounded(self):
+        render = codegen.compile_renderer(parse(self.text), 'list')
+        for i in range(codegen.SHAPE_CACHE_SIZE + 10):
+            (query, bound_variables) = render(dict(use_status=False, items=[dict(id=0)] * (i + 1)))
+            assert query.count('OR id = ?') == i + 1
+        assert len(self.shapes_of(render)) == codegen.SHAPE_CACHE_SIZE
+
+    def test_large_renders_are_not_cached(self):
+        render = codegen.compile_renderer(parse(self.text), 'list')
+        items = [dict(id=i) for i in range(codegen.SHAPE_MAX_SIGNATURE + 1)]
+        (query, bound_variables) = render(dict(use_status=False, items=items))
+        assert query.count('OR id = ?') == len(items)
+        assert len(self.shapes_of(render)) == 0
+
+        render = codegen.compile_renderer(parse("SELECT * FROM t WHERE id IN /*:ids*/(1)"), 'list')
+        ids = range(codegen.SHAPE_MAX_SQL_LENGTH // 3)
+        (query, bound_variables) = render(dict(ids=ids))
+        assert bound_variables == ids
+        assert len(self.shapes_of(render)) == 0
@@ -0,0 +1,70 @@
+import unittest
+import sqlite3
+
+from sqlshade import exc
+from sqlshade.dbapi import Executor
+from sqlshade.lookup import TemplateLookup
+from sqlshade.template import Template
+
+class ExecutorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = sqlite3.connect(':memory:')
+        self.connection.execute("CREATE TABLE t_member (id INTEGER, name TEXT)")
+        self.executor = Executor(self.connection)
+        self.insert = Template("INSERT INTO t_member VALUES (/*:id*/1, /*:name*/'')")
+        self.select = Template("SELECT name FROM t_member WHERE id IN /*:ids*/(1) ORDER BY id")
+
+    def tearDown(self):
+        self.executor.close()
+        self.connection.close()
+
+    def test_execute_and_fetch(self):
+        self.executor.execute(self.insert, id=1, name='alice')
+        self.executor.execute(self.insert, id=2, name='bob')
+        assert self.executor.fetchall(self.select, ids=[1, 2]) == [('alice',), ('bob',)]
+        assert self.executor.fetchone(self.select, ids=[2]) == ('bob',)
+        assert self.executor.fetchmany(self.select, 1, ids=[1, 2]) == [('alice',)]
+
+    def test_executemany(self):
+        cursor = self.executor.executemany(self.insert, [{'id': i, 'name': 'm%d' % i} for i in range(5)])
+        assert cursor is not None
+        assert self.executor.fetchall(self.select, ids=[3, 4]) == [('m3',), ('m4',)]
+        assert self.executor.executemany(self.insert, []) is None
+
+    def test_cursor_reused_per_query(self):
+        first = self.executor.execute(self.select, ids=[1])
+        assert self.executor.execute(self.select, ids=[2]) is first
+        assert self.executor.execute(self.select, ids=[1, 2]) is not first
+
+    def test_evicted_cursor_closed(self):
+        executor = Executor(self.connection, cursor_cache_size=1)
+        first = executor.execute(self.select, ids=[1])
+        executor.execute(self.select, ids=[1, 2])
+        self.assertRaises(sqlite3.ProgrammingError, first.fetchall)
+        executor.close()
+
+    def test_lookup(self):
+        lookup = TemplateLookup()
+        lookup.put_string('insert.sql', "INSERT INTO t_member VALUES (/*:id*/1, 'carol')")
+        executor = Executor(self.connection, lookup=lookup)
+        executor.execute('insert.sql', id=3)
+        assert executor.fetchall(self.select, ids=[3]) == [('carol',)]
+        self.assertRaises(exc.ArgumentError, self.executor.execute, 'insert.sql', id=3)
+
+    def test_connect(self):
+        connections = []
+        def connect():
+            connections.append(sqlite3.connect(':memory:'))
+            return connections[-1]
+        executor = Executor(connect=connect)
+        assert connections == []
+        assert executor.fetchone(Template("SELECT /*:n*/0 + 1"), n=1) == (2,)
+        executor.close()
+        self.assertRaises(sqlite3.ProgrammingError, connections[0].execute, "SELECT 1")
+
+    def test_connection_required(self):
+        self.assertRaises(exc.ArgumentError, Executor)
+
+if __name__ == '__main__':
+    unittest.main()
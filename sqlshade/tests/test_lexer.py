@@ -264,3 +264,55 @@ this line is fake value too.
         assert parse(") ") == -1
         assert parse("()", should_be_close_paren) == 2
         assert parse("()", should_be_close_paren) == 2
+
+    def test_adjoining_comments(self):
+        nodes = self.parse("""SELECT 1 /* first *//* second */-- third\n/* fourth */""")
+        assert [type(n) for n in nodes] == [tree.Literal, tree.Comment, tree.Comment, tree.Comment, tree.Literal, tree.Comment]
+        assert [n.text for n in nodes] == ['SELECT 1 ', ' first ', ' second ', ' third', '\n', ' fourth ']
+        assert [n.is_block for n in nodes if isinstance(n, tree.Comment)] == [True, True, False, True]
+
+    def test_unmatched_comment_opening_is_literal(self):
+        nodes = self.parse("""SELECT /*:ident*/ /*#unknown item in a+b*/ FROM t_member""")
+        assert [type(n) for n in nodes] == [tree.Literal, tree.Literal, tree.Literal]
+        assert [n.text for n in nodes] == ['SELECT ', '/*:ident*/ ', '/*#unknown item in a+b*/ FROM t_member']
+
+    def test_escaped_newline(self):
+        nodes = self.parse("""SELECT 1 \\\nFROM t_member""")
+        assert [n.text for n in nodes] == ['SELECT 1 ', 'FROM t_member']
+        assert (nodes[1].lineno, nodes[1].pos) == (2, 1)
+
+    def test_position(self):
+        nodes = self.parse("""SELECT *\n  FROM t_member\n WHERE id = /*:id*/1 /*#if a*/\n/*#/if*/""")
+        assert (nodes[0].lineno, nodes[0].pos) == (1, 1)
+        assert (nodes[1].lineno, nodes[1].pos) == (3, 20)
+        assert (nodes[2].lineno, nodes[2].pos) == (3, 21)
+        assert (nodes[3].lineno, nodes[3].pos) == (3, 22)
+
+    def test_error_position(self):
+        try:
+            self.parse("""SELECT *\n  FROM t_member /*#if a*/\n WHERE /*#/for*/""")
+        except exc.SyntaxError, e:
+            assert (e.lineno, e.pos) == (3, 8)
+        else:
+            assert False
+
+    def test_offset_position(self):
+        lex = lexer.Lexer("SELECT *\n  FROM t_member\n\nWHERE TRUE")
+        lex.parse()
+        assert lex.position(0) == (1, 1)
+        assert lex.position(7) == (1, 8)
+        assert lex.position(8) == (1, 9)
+        assert lex.position(9) == (2, 1)
+        assert lex.position(11) == (2, 3)
+        assert lex.position(24) == (2, 16)
+        assert lex.position(25) == (3, 1)
+        assert lex.position(26) == (4, 1)
+
+    def test_parse_until_end_of_sqlword_from_offset(self):
+        parse = lexer.Lexer.parse_until_end_of_sqlword
+        text = "id IN /*:ids*/('foo', 'b)r') AND created_at <= /*:ts*/now() AND "
+        assert parse(text, ")", text.index("('foo'")) == len("('foo', 'b)r')")
+        assert parse(text, None, text.index("now()")) == len("now()")
+        assert parse(text, None, len(text)) == -1
+        assert parse("x = CURRENT_TIMESTAMP", None, 4) == len("CURRENT_TIMESTAMP")
+        assert parse("x = (1, 2", ")", 4) == -1
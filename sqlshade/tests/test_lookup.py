@@ -0,0 +1,248 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from sqlshade import exc, util, tree
+from sqlshade.lexer import Lexer
+from sqlshade.lookup import TemplateLookup
+from sqlshade.template import Template
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_discard_least_recently_used(self):
+        cache = util.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        assert cache['a'] == 1
+        cache['c'] = 3
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert 'c' in cache
+        assert len(cache) == 2
+        assert cache.get('b') is None
+
+    def test_unbounded(self):
+        cache = util.LRUCache(-1)
+        for i in range(100):
+            cache[i] = i
+        assert len(cache) == 100
+
+    def test_on_evict(self):
+        evicted = []
+        cache = util.LRUCache(1, on_evict=lambda key, value: evicted.append((key, value)))
+        cache['a'] = 1
+        cache['a'] = 2
+        assert evicted == []
+        cache['b'] = 3
+        assert evicted == [('a', 2)]
+
+class TemplateDirectoryTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        for d in self.dirs:
+            shutil.rmtree(d)
+
+    def write(self, index, uri, text):
+        path = os.path.join(self.dirs[index], *uri.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        f = open(path, 'wb')
+        try:
+            f.write(text)
+        finally:
+            f.close()
+        return path
+
+class TemplateLookupTest(TemplateDirectoryTestCase):
+
+    def setUp(self):
+        self.dirs = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+        self.write(0, 'member.sql', "SELECT * FROM t_member WHERE id = /*:id*/1")
+        self.write(1, 'member.sql', "SELECT * FROM t_shadowed")
+        self.write(1, 'queries/favorite.sql', "SELECT * FROM t_favorite WHERE id = /*:id*/1")
+
+    def test_get_template(self):
+        lookup = TemplateLookup(self.dirs)
+        template = lookup.get_template('member.sql')
+        assert template.uri == 'member.sql'
+        assert template.filename == os.path.join(self.dirs[0], 'member.sql')
+        assert template.render(id=10) == ("SELECT * FROM t_member WHERE id = ?", [10])
+
+        template = lookup.get_template('/queries/favorite.sql')
+        assert template.uri == 'queries/favorite.sql'
+        assert template.render(id=10) == ("SELECT * FROM t_favorite WHERE id = ?", [10])
+
+    def test_template_arguments(self):
+        lookup = TemplateLookup(self.dirs, parameter_format='dict')
+        assert lookup.get_template('member.sql').render(id=10) == \
+            ("SELECT * FROM t_member WHERE id = :id", {'id': 10})
+
+    def test_cached(self):
+        lookup = TemplateLookup(self.dirs)
+        assert lookup.get_template('member.sql') is lookup.get_template('member.sql')
+
+    def test_not_found(self):
+        lookup = TemplateLookup(self.dirs)
+        self.assertRaises(exc.TemplateLookupError, lookup.get_template, 'notfound.sql')
+        self.assertRaises(exc.TemplateLookupError, lookup.get_template, '..')
+        assert lookup.get_template('../queries/../member.sql').uri == 'member.sql'
+        assert lookup.has_template('member.sql')
+        assert not lookup.has_template('notfound.sql')
+
+    def test_reload_modified_file(self):
+        lookup = TemplateLookup(self.dirs)
+        template = lookup.get_template('member.sql')
+        path = self.write(0, 'member.sql', "SELECT * FROM t_member_modified")
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime + 10))
+        reloaded = lookup.get_template('member.sql')
+        assert reloaded is not template
+        assert reloaded.render() == ("SELECT * FROM t_member_modified", [])
+
+    def test_check_interval(self):
+        lookup = TemplateLookup(self.dirs, check_interval=3600)
+        template = lookup.get_template('member.sql')
+        self.write(0, 'member.sql', "SELECT * FROM t_member_modified")
+        assert lookup.get_template('member.sql') is template
+
+        lookup = TemplateLookup(self.dirs, filesystem_checks=False)
+        template = lookup.get_template('member.sql')
+        self.write(0, 'member.sql', "SELECT * FROM t_member_modified_again")
+        assert lookup.get_template('member.sql') is template
+
+    def test_removed_file(self):
+        lookup = TemplateLookup(self.dirs)
+        lookup.get_template('queries/favorite.sql')
+        os.remove(os.path.join(self.dirs[1], 'queries', 'favorite.sql'))
+        self.assertRaises(exc.TemplateLookupError, lookup.get_template, 'queries/favorite.sql')
+
+    def test_collection_size(self):
+        lookup = TemplateLookup(self.dirs, collection_size=1)
+        template = lookup.get_template('member.sql')
+        lookup.get_template('queries/favorite.sql')
+        assert len(lookup._collection) == 1
+        assert lookup.get_template('member.sql') is not template
+
+        assert TemplateLookup(self.dirs)._collection.capacity == 500
+        lookup = TemplateLookup(self.dirs, collection_size=-1)
+        lookup.get_template('member.sql')
+        lookup.get_template('queries/favorite.sql')
+        assert len(lookup._collection) == 2
+
+    def test_put_string(self):
+        lookup = TemplateLookup(self.dirs, collection_size=0)
+        lookup.put_string('memory/where.sql', "WHERE id = /*:id*/1")
+        template = lookup.get_template('memory/where.sql')
+        assert template.uri == 'memory/where.sql'
+        assert template.render(id=1) == ("WHERE id = ?", [1])
+        assert lookup.get_template('memory/where.sql') is template
+
+    def test_threads(self):
+        lookup = TemplateLookup(self.dirs, collection_size=1)
+        errors = []
+        def run():
+            try:
+                for i in range(200):
+                    uri = ('member.sql', 'queries/favorite.sql')[i % 2]
+                    assert lookup.get_template(uri).uri == uri
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=run) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert errors == []
+
+class IncludeTest(TemplateDirectoryTestCase):
+
+    def setUp(self):
+        self.dirs = [tempfile.mkdtemp()]
+        self.write(0, 'member.sql',
+                   "SELECT * FROM t_member WHERE /*#include where/active.sql*/TRUE/*#/include*/")
+        self.write(0, 'where/active.sql',
+                   "status = /*:status*/1 AND /*#include where/ids.sql*/TRUE/*#/include*/")
+        self.write(0, 'where/ids.sql', "id IN /*#for id in ids*//*:id*/1 /*#/for*/")
+
+    def test_include(self):
+        lookup = TemplateLookup(self.dirs)
+        template = lookup.get_template('member.sql')
+        assert template.render(status=2, ids=[3, 4]) == \
+            ("SELECT * FROM t_member WHERE status = ? AND id IN ? ? ", [2, 3, 4])
+        assert [uri for (uri, included) in template.includes] == ['where/active.sql']
+        assert not [n for n in template.node.get_children() if isinstance(n, tree.Include)]
+        for query, params in template.render_chunks(max_params=2, status=2, ids=[3, 4]):
+            assert query.startswith("SELECT * FROM t_member WHERE status = ? AND id IN ")
+
+    def test_included_trees_shared(self):
+        lookup = TemplateLookup(self.dirs)
+        self.write(0, 'other.sql', "SELECT 1 WHERE /*#include where/ids.sql*/TRUE/*#/include*/")
+        ids = lookup.get_template('where/ids.sql').node.get_children()[1]
+        assert lookup.get_template('other.sql').node.get_children()[2] is ids
+
+    def test_reload_modified_include(self):
+        lookup = TemplateLookup(self.dirs)
+        template = lookup.get_template('member.sql')
+        path = self.write(0, 'where/ids.sql', "id = /*:id*/1")
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime + 10))
+        reloaded = lookup.get_template('member.sql')
+        assert reloaded is not template
+        assert reloaded.render(status=2, id=3) == \
+            ("SELECT * FROM t_member WHERE status = ? AND id = ?", [2, 3])
+        assert lookup.get_template('member.sql') is reloaded
+
+    def test_cyclic_include(self):
+        self.write(0, 'where/ids.sql', "/*#include member.sql*/TRUE/*#/include*/")
+        lookup = TemplateLookup(self.dirs)
+        self.assertRaises(exc.CompileError, lookup.get_template, 'member.sql')
+        self.write(0, 'self.sql', "/*#include ./self.sql*/TRUE/*#/include*/")
+        self.assertRaises(exc.CompileError, lookup.get_template, 'self.sql')
+
+    def test_missing_include(self):
+        self.write(0, 'where/active.sql', "/*#include where/missing.sql*/TRUE/*#/include*/")
+        lookup = TemplateLookup(self.dirs)
+        self.assertRaises(exc.CompileError, lookup.get_template, 'member.sql')
+        self.assertRaises(exc.CompileError, Template, "/*#include where/ids.sql*/TRUE/*#/include*/")
+
+    def test_threads_mixing_loads_and_includes(self):
+        # a slow lexer widens the window in which one thread holds the lookup
+        # while compiling, and another compiles a template including from it
+        parse = Lexer.parse
+        def slow_parse(lexer):
+            time.sleep(0.01)
+            return parse(lexer)
+        Lexer.parse = slow_parse
+        try:
+            for i in range(5):
+                lookup = TemplateLookup(self.dirs)
+                errors = []
+                def load():
+                    try:
+                        lookup.get_template('member.sql')
+                    except Exception, e:
+                        errors.append(e)
+                def include():
+                    try:
+                        Template("SELECT /*#include where/active.sql*/x/*#/include*/", lookup=lookup,
+                                 lazy=True).render(status=1, ids=[1])
+                    except Exception, e:
+                        errors.append(e)
+                threads = [threading.Thread(target=(include, load)[n % 2]) for n in range(6)]
+                for t in threads:
+                    t.setDaemon(True)
+                    t.start()
+                for t in threads:
+                    t.join(10)
+                assert not [t for t in threads if t.isAlive()], "threads deadlocked"
+                assert errors == []
+        finally:
+            Lexer.parse = parse
+
+    def test_put_string(self):
+        lookup = TemplateLookup(self.dirs)
+        lookup.put_string('memory.sql', "SELECT 1 FROM /*#include where/ids.sql*/t/*#/include*/")
+        assert lookup.get_template('memory.sql').render(ids=[1]) == ("SELECT 1 FROM id IN ? ", [1])
@@ -0,0 +1,46 @@
+import unittest
+import gc
+
+from sqlshade import resolver
+from sqlshade.resolver import Resolver
+
+class Member(object):
+
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+class ResolverTest(unittest.TestCase):
+
+    def test_single_name(self):
+        assert Resolver('id')(dict(id=1)) == 1
+        self.assertRaises(KeyError, Resolver('id'), dict())
+
+    def test_dotted_name_in_mappings(self):
+        resolve = Resolver('item.group.name')
+        assert resolve(dict(item=dict(group=dict(name='abc')))) == 'abc'
+        self.assertRaises(KeyError, resolve, dict(item=dict(group=dict())))
+        self.assertRaises(KeyError, resolve, dict(item=dict()))
+
+    def test_dotted_name_in_attributes(self):
+        resolve = Resolver('item.group.name')
+        assert resolve(dict(item=Member(group=Member(name='abc')))) == 'abc'
+        assert resolve(dict(item=Member(group=dict(name='def')))) == 'def'
+        self.assertRaises(KeyError, resolve, dict(item=Member(group=Member())))
+
+    def test_classes_are_not_kept_alive(self):
+        cls = type('Dynamic', (object,), {})
+        value = cls()
+        value.name = 'abc'
+        assert Resolver('item.name')(dict(item=value)) == 'abc'
+        assert cls in resolver._accessors
+        count = len(resolver._accessors)
+        del cls, value
+        gc.collect()
+        assert len(resolver._accessors) == count - 1
+
+    def test_empty_name(self):
+        self.assertRaises(KeyError, Resolver('item.'), dict(item=dict()))
+        self.assertRaises(KeyError, Resolver('.item'), dict(item=dict()))
+
+if __name__ == '__main__':
+    unittest.main()
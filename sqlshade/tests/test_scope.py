@@ -0,0 +1,23 @@
+import unittest
+
+from sqlshade.scope import Scope
+
+class ScopeTest(unittest.TestCase):
+
+    def test_lookup_through_frames(self):
+        data = dict(a=1, item=0)
+        scope = Scope(Scope(data, 'item', 2), 'row', 3)
+        assert scope['a'] == 1
+        assert scope['item'] == 2
+        assert scope['row'] == 3
+        self.assertRaises(KeyError, lambda: scope['missing'])
+        assert scope.get('missing') is None
+        assert 'row' in scope and 'missing' not in scope
+
+    def test_inner_frame_shadows(self):
+        scope = Scope(Scope(dict(), 'item', 1), 'item', 2)
+        assert scope['item'] == 2
+        assert scope.parent['item'] == 1
+
+if __name__ == '__main__':
+    unittest.main()
@@ -291,3 +291,149 @@ class QueryCompilationTest(unittest.TestCase):
             }
         }
         assert resolve('top.second.third.data', complex_context_data) == 'complex structure data'
+
+class DispatchTableTest(unittest.TestCase):
+
+    def test_table_is_built_once(self):
+        table = sqlgen.RenderListStatement.get_dispatch_table('strict')
+        assert sqlgen.RenderListStatement.get_dispatch_table('strict') is table
+        assert sqlgen.RenderDictStatement.get_dispatch_table('strict') is not table
+        assert table[tree.Literal] is sqlgen.RenderListStatement.visitLiteral_strict.im_func
+        assert table[tree.Comment] is sqlgen.RenderListStatement.traverse.im_func
+
+    def test_node_class_defined_later(self):
+        class Wrapper(tree.Node):
+            __slots__ = ('nodes',)
+            def get_children(self):
+                return self.nodes
+        wrapper = Wrapper()
+        wrapper.nodes = [tree.Literal('SELECT 1')]
+        root = tree.TemplateNode('<memory>')
+        root.nodes = [wrapper]
+        assert sqlgen.compile(root, None, {}) == ('SELECT 1', [])
+
+class ListPaddingTest(unittest.TestCase):
+
+    def test_pow2(self):
+        padded_length = sqlgen.get_list_padding('pow2')
+        assert [padded_length(n) for n in range(1, 10)] == [1, 2, 4, 4, 8, 8, 8, 8, 16]
+
+    def test_buckets(self):
+        padded_length = sqlgen.get_list_padding([10, 1, 5])
+        assert [padded_length(n) for n in (1, 2, 5, 6, 10, 11)] == [1, 5, 5, 10, 10, 11]
+
+    def test_no_padding(self):
+        assert sqlgen.get_list_padding(None) is None
+        assert sqlgen.get_list_padding(False) is None
+
+    def test_unsupported_padding(self):
+        from sqlshade import exc
+        self.assertRaises(exc.ArgumentError, sqlgen.get_list_padding, 'pow3')
+        self.assertRaises(exc.ArgumentError, sqlgen.get_list_padding, [0, 4])
+
+    def test_pad_list(self):
+        padded_length = sqlgen.get_list_padding('pow2')
+        assert sqlgen.pad_list((1, 2, 3), padded_length) == [1, 2, 3, 3]
+        variable = [1, 2]
+        assert sqlgen.pad_list(variable, padded_length) is variable
+        assert sqlgen.pad_list((1, 2, 3), None) == (1, 2, 3)
+
+    def test_compile_with_padding(self):
+        from sqlshade.lexer import Lexer
+        node = Lexer("SELECT * FROM t_member WHERE id IN /*:ids*/(1, 2)").parse()
+        assert sqlgen.compile(node, None, dict(ids=[1, 2, 3]), list_padding='pow2') == \
+            ("SELECT * FROM t_member WHERE id IN (?, ?, ?, ?)", [1, 2, 3, 3])
+        assert sqlgen.compile(node, None, dict(ids=[1, 2, 3]), list_padding=[5],
+                              parameter_format='dict') == \
+            ("SELECT * FROM t_member WHERE id IN (:ids_1, :ids_2, :ids_3, :ids_4, :ids_5)",
+             dict(ids_1=1, ids_2=2, ids_3=3, ids_4=3, ids_5=3))
+
+class CompileChunksTest(unittest.TestCase):
+
+    text = """INSERT INTO t_member (id, name) VALUES (0, 'root')
+        /*#for row in rows*/, (/*:row.id*/1, /*:row.name*/'kjim')/*#/for*/ RETURNING /*:note*/'x'"""
+
+    def parse(self, text):
+        from sqlshade.lexer import Lexer
+        return Lexer(text).parse()
+
+    def rows(self, n):
+        return [dict(id=i, name='name%d' % i) for i in range(n)]
+
+    def test_split_by_params(self):
+        node = self.parse(self.text)
+        chunks = list(sqlgen.compile_chunks(node, None, dict(rows=self.rows(5), note='n'), max_params=5))
+        assert [len(b) for (q, b) in chunks] == [5, 5, 3]
+        assert chunks[0] == ("""INSERT INTO t_member (id, name) VALUES (0, 'root')
+        , (?, ?), (?, ?) RETURNING ?""", [0, 'name0', 1, 'name1', 'n'])
+        assert chunks[2][1] == [4, 'name4', 'n']
+
+    def test_split_by_size(self):
+        node = self.parse(self.text)
+        whole = sqlgen.compile(node, None, dict(rows=self.rows(1), note='n'))[0]
+        chunks = list(sqlgen.compile_chunks(node, None, dict(rows=self.rows(4), note='n'),
+                                            max_size=len(whole) + len(', (?, ?)')))
+        assert len(chunks) == 2
+        assert [q.count('(?, ?)') for (q, b) in chunks] == [2, 2]
+
+    def test_dict_parameters(self):
+        node = self.parse(self.text)
+        chunks = list(sqlgen.compile_chunks(node, None, dict(rows=self.rows(3), note='n'),
+                                            max_params=5, parameter_format='dict'))
+        assert len(chunks) == 2
+        assert ', (:row__dot__id_3, :row__dot__name_3)' in chunks[1][0]
+        assert chunks[1][1] == dict(row__dot__id_3=2, row__dot__name_3='name2', note='n')
+
+    def test_repeated_names_counted_once(self):
+        node = self.parse("INSERT INTO t (id, kind) VALUES "
+                          "/*#for r in rows*/(/*:r*/1, /*:kind*/'a') /*#/for*/RETURNING /*:kind*/'a'")
+        for parameter_format in ('dict', 'pyformat'):
+            chunks = list(sqlgen.compile_chunks(node, None, dict(rows=range(5), kind='k'),
+                                                max_params=3, parameter_format=parameter_format))
+            assert [len(b) for (q, b) in chunks] == [3, 3, 2]
+            assert chunks[2][1] == dict(r_5=4, kind='k')
+
+    def test_numeric_parameters(self):
+        node = self.parse("INSERT INTO t (id, tag) VALUES "
+                          "/*#for r in rows*/(/*:r*/1, /*:tag*/'a') /*#/for*/RETURNING /*:tag*/'a'")
+        chunks = list(sqlgen.compile_chunks(node, None, dict(rows=[10, 11, 12], tag='t'),
+                                            max_params=3, parameter_format='numeric'))
+        assert chunks == [
+            ("INSERT INTO t (id, tag) VALUES ($2, $1) ($3, $1) RETURNING $1", ['t', 10, 11]),
+            ("INSERT INTO t (id, tag) VALUES ($2, $1) RETURNING $1", ['t', 12]),
+        ]
+        node = self.parse(self.text)
+        data = dict(rows=self.rows(3), note='n')
+        assert list(sqlgen.compile_chunks(node, None, dict(data), parameter_format='numeric')) == \
+            [("""INSERT INTO t_member (id, name) VALUES (0, 'root')
+        , ($2, $3), ($4, $5), ($6, $7) RETURNING $1""", ['n', 0, 'name0', 1, 'name1', 2, 'name2'])]
+        chunks = list(sqlgen.compile_chunks(node, None, dict(data), max_params=5,
+                                            parameter_format='numeric'))
+        assert chunks[1] == ("""INSERT INTO t_member (id, name) VALUES (0, 'root')
+        , ($2, $3) RETURNING $1""", ['n', 2, 'name2'])
+
+    def test_no_limits(self):
+        node = self.parse(self.text)
+        data = dict(rows=self.rows(3), note='n')
+        assert list(sqlgen.compile_chunks(node, None, dict(data))) == \
+            [sqlgen.compile(node, None, dict(data))]
+
+    def test_no_rows(self):
+        node = self.parse(self.text)
+        data = dict(rows=[], note='n')
+        assert list(sqlgen.compile_chunks(node, None, dict(data), max_params=3)) == \
+            [sqlgen.compile(node, None, dict(data))]
+
+    def test_no_loop(self):
+        node = self.parse("SELECT * FROM t_member WHERE id IN /*:ids*/(1)")
+        assert list(sqlgen.compile_chunks(node, None, dict(ids=[1, 2]), max_params=2)) == \
+            [("SELECT * FROM t_member WHERE id IN (?, ?)", [1, 2])]
+        chunks = sqlgen.compile_chunks(node, None, dict(ids=[1, 2, 3]), max_params=2)
+        from sqlshade import exc
+        self.assertRaises(exc.RenderError, list, chunks)
+
+    def test_row_too_large(self):
+        node = self.parse(self.text)
+        chunks = sqlgen.compile_chunks(node, None, dict(rows=self.rows(3), note='n'), max_params=2)
+        from sqlshade import exc
+        self.assertRaises(exc.RenderError, list, chunks)
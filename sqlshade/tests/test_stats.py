@@ -0,0 +1,53 @@
+import unittest
+
+from sqlshade import stats
+from sqlshade.template import Template
+
+class StatsTest(unittest.TestCase):
+
+    def setUp(self):
+        stats.reset()
+        self.template = Template("SELECT * FROM t_member WHERE id IN /*:ids*/(1, 2)", uri='member.sql')
+
+    def tearDown(self):
+        stats.disable()
+        stats.reset()
+
+    def test_disabled(self):
+        self.template.render(ids=[1])
+        assert stats.snapshot() == {}
+
+    def test_record(self):
+        stats.enable()
+        self.template.render(ids=[1])
+        self.template.render(ids=[1, 2, 3])
+        list(self.template.render_many([dict(ids=[4])]))
+        self.template.render_executemany([dict(ids=[5, 6]), dict(ids=[7, 8])])
+        snapshot = stats.snapshot()
+        assert snapshot.keys() == ['member.sql']
+        s = snapshot['member.sql']
+        assert s['count'] == 5
+        assert s['max_params'] == 3
+        assert s['mean_params'] == 9 / 5.0
+        assert s['max_sql_length'] == len(self.template.render(ids=[1, 2, 3])[0])
+        assert s['shapes'] == 3
+        assert 0 < s['p50_time'] <= s['p99_time'] <= s['max_time'] <= s['total_time']
+        assert sum([n for (bound, n) in s['histogram']]) == 5
+
+    def test_percentile(self):
+        t = stats.TemplateStats('t')
+        for elapsed in [0.0000015] * 90 + [0.003] * 10:
+            t.add(elapsed, ('', []))
+        assert t.percentile(50) == 0.000002
+        assert t.percentile(90) == 0.000002
+        assert t.percentile(99) == 0.003
+        assert stats.TemplateStats('empty').percentile(50) == 0.0
+
+    def test_reset(self):
+        stats.enable()
+        self.template.render(ids=[1])
+        stats.reset()
+        assert stats.snapshot() == {}
+
+if __name__ == '__main__':
+    unittest.main()
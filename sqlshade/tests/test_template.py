@@ -1,9 +1,14 @@
 import unittest
+import codecs
 import copy
+import os
+import shutil
+import tempfile
 from datetime import datetime
 
 from sqlshade import exc
-from sqlshade.template import Template
+from sqlshade import template as template_module
+from sqlshade.template import Template, warm
 
 class SubstituteAnyCaseTest(unittest.TestCase):
 
@@ -211,6 +216,343 @@ class EmbedAnyCaseTest(unittest.TestCase):
         """
         assert bound_variables == {'member_ids_1': 23, 'member_ids_2': 535, 'member_ids_3': 2}
 
+    def test_embed_template(self):
+        condition = Template("status = /*:status*/1")
+        for parameter_format in ('list', 'dict', 'numeric'):
+            template = Template("SELECT * FROM t_member WHERE id = /*:id*/1 AND /*#embed condition*/TRUE/*#/embed*/",
+                                parameter_format=parameter_format)
+            (query, bound_variables) = template.render(id=1, status=2, condition=condition)
+            assert query == template.render(id=1, status=2, condition=condition.node)[0]
+            assert 'TRUE' not in query
+        context = dict(id=1, status=2, condition=condition)
+        template.render_executemany([context])
+        assert context['condition'] is condition
+
+class RenderManyTest(unittest.TestCase):
+
+    text = """SELECT * FROM t_member WHERE status = /*:status*/1 AND id IN /*:ids*/(1, 2)"""
+
+    def test_render_many(self):
+        template = Template(self.text)
+        contexts = [dict(status=1, ids=[1]), dict(status=2, ids=[2, 3])]
+        rendered = list(template.render_many(contexts))
+        assert rendered == [template.render(**context) for context in contexts]
+        assert rendered[1] == ("SELECT * FROM t_member WHERE status = ? AND id IN (?, ?)", [2, 2, 3])
+        assert contexts == [dict(status=1, ids=[1]), dict(status=2, ids=[2, 3])]
+
+    def test_render_many_embed_template(self):
+        template = Template("""SELECT * FROM t_member WHERE /*#embed where*/TRUE/*#/embed*/""")
+        where = Template("""status = /*:status*/1""")
+        rendered = list(template.render_many([dict(where=where, status=1), dict(where='FALSE')]))
+        assert rendered == [("SELECT * FROM t_member WHERE status = ?", [1]),
+                            ("SELECT * FROM t_member WHERE FALSE", [])]
+
+    def test_render_many_is_lazy(self):
+        template = Template(self.text)
+        rendered = template.render_many([dict(status=1, ids=[1]), dict()])
+        assert rendered.next() == ("SELECT * FROM t_member WHERE status = ? AND id IN (?)", [1, 1])
+        self.assertRaises(exc.RenderError, rendered.next)
+
+    def test_render_executemany(self):
+        template = Template(self.text)
+        query, rows = template.render_executemany(
+            [dict(status=1, ids=[1, 2]), dict(status=2, ids=(3, 4))])
+        assert query == "SELECT * FROM t_member WHERE status = ? AND id IN (?, ?)"
+        assert rows == [[1, 1, 2], [2, 3, 4]]
+
+        template = Template(self.text, parameter_format='dict')
+        query, rows = template.render_executemany(
+            iter([dict(status=1, ids=[1]), dict(status=2, ids=[3])]))
+        assert query == "SELECT * FROM t_member WHERE status = :status AND id IN (:ids_1)"
+        assert rows == [dict(status=1, ids_1=1), dict(status=2, ids_1=3)]
+
+    def test_render_executemany_different_queries(self):
+        template = Template(self.text)
+        self.assertRaises(exc.RenderError, template.render_executemany,
+                          [dict(status=1, ids=[1]), dict(status=2, ids=[2, 3])])
+
+    def test_render_executemany_no_context(self):
+        assert Template(self.text).render_executemany([]) == (None, [])
+
+class ParamstyleTest(unittest.TestCase):
+
+    text = """SELECT * FROM t_member WHERE name LIKE '%kjim%'
+        AND id = /*:id*/1 AND status IN /*:status*/(1, 2) AND id <> /*:id*/2"""
+
+    context = dict(id=3, status=[1, 2])
+
+    def test_qmark(self):
+        query, bound_variables = Template(self.text, parameter_format='qmark').render(**self.context)
+        assert query.endswith("AND id = ? AND status IN (?, ?) AND id <> ?")
+        assert "'%kjim%'" in query
+        assert bound_variables == [3, 1, 2, 3]
+
+    def test_named(self):
+        query, bound_variables = Template(self.text, parameter_format='named').render(**self.context)
+        assert query.endswith("AND id = :id AND status IN (:status_1, :status_2) AND id <> :id")
+        assert bound_variables == dict(id=3, status_1=1, status_2=2)
+
+    def test_format(self):
+        query, bound_variables = Template(self.text, parameter_format='format').render(**self.context)
+        assert query.endswith("AND id = %s AND status IN (%s, %s) AND id <> %s")
+        assert "'%%kjim%%'" in query
+        assert bound_variables == [3, 1, 2, 3]
+        assert query % tuple(bound_variables) == """SELECT * FROM t_member WHERE name LIKE '%kjim%'
+        AND id = 3 AND status IN (1, 2) AND id <> 3"""
+
+    def test_pyformat(self):
+        query, bound_variables = Template(self.text, parameter_format='pyformat').render(**self.context)
+        assert query.endswith("AND id = %(id)s AND status IN (%(status_1)s, %(status_2)s) AND id <> %(id)s")
+        assert "'%%kjim%%'" in query
+        assert bound_variables == dict(id=3, status_1=1, status_2=2)
+
+    def test_numeric(self):
+        query, bound_variables = Template(self.text, parameter_format='numeric').render(**self.context)
+        assert query.endswith("AND id = $1 AND status IN ($2, $3) AND id <> $1")
+        assert "'%kjim%'" in query
+        assert bound_variables == [3, 1, 2]
+
+    def test_numeric_scalar_variables(self):
+        template = Template("""SELECT * FROM t_member WHERE id = /*:id*/1 AND name = /*:name*/'a' OR id = /*:id*/2""",
+                            parameter_format='numeric')
+        assert template.render(id=1, name='kjim') == \
+            ("SELECT * FROM t_member WHERE id = $1 AND name = $2 OR id = $1", [1, 'kjim'])
+
+    def test_numeric_nested_loops(self):
+        template = Template("""INSERT INTO t_child (parent_id, name) VALUES /*#for p in parents*/
+            /*#for c in p.children*/(/*:p.id*/1, /*:c.name*/'x') /*#/for*//*#/for*/""",
+                            parameter_format='numeric')
+        parents = [dict(id=10, children=[dict(name='a'), dict(name='b')]),
+                   dict(id=20, children=[dict(name='c')])]
+        query, bound_variables = template.render(parents=parents)
+        assert ' '.join(query.split()).endswith("VALUES ($1, $2) ($3, $4) ($5, $6)")
+        assert bound_variables == [10, 'a', 10, 'b', 20, 'c']
+
+        chunks = list(template.render_stream(parents=parents))
+        assert ''.join([q for (q, b) in chunks]) == query
+        assert sum([b for (q, b) in chunks], []) == bound_variables
+        chunks = list(template.render_chunks(max_params=4, parents=parents))
+        assert [b for (q, b) in chunks] == [[10, 'a', 10, 'b'], [20, 'c']]
+        assert ' '.join(chunks[1][0].split()).endswith("VALUES ($1, $2)")
+
+    def test_numeric_loop_array_binds(self):
+        template = Template("""SELECT * FROM t_member WHERE FALSE /*#for g in groups*/
+            /*#for k in g.kinds*/OR (kind = /*:k*/'a' AND id IN /*:g.ids*/(1))/*#/for*//*#/for*/""",
+                            parameter_format='numeric', array_binds='postgresql')
+        groups = [dict(ids=[1, 2], kinds=['a', 'b']), dict(ids=[3], kinds=['c'])]
+        query, bound_variables = template.render(groups=groups)
+        assert bound_variables == ['a', [1, 2], 'b', [1, 2], 'c', [3]]
+        assert query.count('unnest($') == 3
+        assert [b for (q, b) in template.render_chunks(groups=groups)] == [bound_variables]
+
+    def test_numeric_embedded_in_loop(self):
+        template = Template("""SELECT * FROM t_member WHERE FALSE
+            /*#for item in items*/OR /*#embed cond*/TRUE/*#/embed*/ /*#/for*/""",
+                            parameter_format='numeric')
+        cond = Template("id = /*:item.id*/1 AND kind = /*:kind*/'a' AND id <> /*:item.id*/2")
+        context = dict(items=[dict(id=1), dict(id=2)], kind='k', cond=cond)
+        query, bound_variables = template.render(**context)
+        assert query.split('FALSE')[1].split() == \
+            ['OR', 'id', '=', '$1', 'AND', 'kind', '=', '$2', 'AND', 'id', '<>', '$1',
+             'OR', 'id', '=', '$3', 'AND', 'kind', '=', '$4', 'AND', 'id', '<>', '$3']
+        assert bound_variables == [1, 'k', 2, 'k']
+        assert list(template.render_chunks(**context)) == [(query, bound_variables)]
+
+    def test_embed_string_is_escaped(self):
+        template = Template("""SELECT * FROM t_member WHERE /*#embed cond*/TRUE/*#/embed*/""",
+                            parameter_format='format')
+        assert template.render(cond="name LIKE 'k%'")[0] == "SELECT * FROM t_member WHERE name LIKE 'k%%'"
+
+class RenderStreamTest(unittest.TestCase):
+
+    text = """INSERT INTO t_member (id, name) VALUES (0, 'root')
+        /*#for row in rows*/, (/*:row.id*/1, /*:row.name*/'kjim')/*#/for*/"""
+
+    def rows(self, n, consumed):
+        for i in range(n):
+            consumed.append(i)
+            yield dict(id=i, name='name%d' % i)
+
+    def test_chunks_join_to_render(self):
+        for parameter_format in ('list', 'dict'):
+            template = Template(self.text, parameter_format=parameter_format)
+            chunks = list(template.render_stream(10, rows=self.rows(20, [])))
+            assert len(chunks) > 1
+            query, bound_variables = template.render(rows=list(self.rows(20, [])))
+            assert ''.join([q for (q, b) in chunks]) == query
+            if parameter_format == 'list':
+                assert sum([b for (q, b) in chunks], []) == bound_variables
+            else:
+                merged = {}
+                for (q, b) in chunks:
+                    merged.update(b)
+                assert merged == bound_variables
+
+    def test_rows_are_consumed_lazily(self):
+        template = Template(self.text)
+        consumed = []
+        stream = template.render_stream(11, rows=self.rows(1000, consumed))
+        query, bound_variables = stream.next()
+        assert query.startswith("INSERT INTO t_member (id, name) VALUES (0, 'root')")
+        assert bound_variables == [0, 'name0', 1, 'name1']
+        assert consumed == [0, 1]
+        stream.next()
+        assert consumed == [0, 1, 2, 3, 4]
+
+    def test_no_for_loop(self):
+        template = Template("""SELECT * FROM t_member WHERE id = /*:id*/1""")
+        assert list(template.render_stream(id=3)) == [("SELECT * FROM t_member WHERE id = ?", [3])]
+
+    def test_render_iterator(self):
+        template = Template(self.text)
+        for i in range(2):
+            query, bound_variables = template.render(rows=self.rows(2, []))
+            assert query.count("(?, ?)") == 2
+            assert bound_variables == [0, 'name0', 1, 'name1']
+
+class RenderChunksTest(unittest.TestCase):
+
+    def test_bulk_insert(self):
+        import sqlite3
+        connection = sqlite3.connect(':memory:')
+        connection.execute("CREATE TABLE t_member (id INTEGER, name TEXT)")
+        template = Template("""INSERT INTO t_member (id, name)
+            /*#for row in rows*/SELECT /*:row.id*/1, /*:row.name*/'kjim' UNION ALL /*#/for*/
+            SELECT NULL, NULL WHERE 0""")
+        rows = (dict(id=i, name='name%d' % i) for i in range(1200))
+        chunks = list(template.render_chunks(max_params=999, rows=rows))
+        assert [len(bound_variables) for (query, bound_variables) in chunks] == [998, 998, 404]
+        for (query, bound_variables) in chunks:
+            connection.execute(query, bound_variables)
+        assert connection.execute("SELECT COUNT(*), MAX(id) FROM t_member").fetchone() == (1200, 1199)
+
+class ListPaddingTest(unittest.TestCase):
+
+    text = """SELECT * FROM t_member WHERE id IN /*:ids*/(1, 2) AND status = /*:status*/1"""
+
+    def test_pow2(self):
+        template = Template(self.text, list_padding='pow2')
+        queries = set()
+        for n in (5, 6, 7, 8):
+            query, bound_variables = template.render(ids=range(n), status=1)
+            queries.add(query)
+            assert bound_variables == range(n) + [n - 1] * (8 - n) + [1]
+        assert queries == set(["SELECT * FROM t_member WHERE id IN (?, ?, ?, ?, ?, ?, ?, ?) AND status = ?"])
+
+    def test_buckets_with_dict_parameters(self):
+        template = Template(self.text, parameter_format='dict', list_padding=[2, 4])
+        query, bound_variables = template.render(ids=(7, 8, 9), status=1)
+        assert query == "SELECT * FROM t_member WHERE id IN (:ids_1, :ids_2, :ids_3, :ids_4) AND status = :status"
+        assert bound_variables == dict(ids_1=7, ids_2=8, ids_3=9, ids_4=9, status=1)
+        query, bound_variables = template.render(ids=range(5), status=1)
+        assert query.count(':ids_') == 5
+
+    def test_embedded_template(self):
+        template = Template("""SELECT * FROM t_member WHERE /*#embed where*/TRUE/*#/embed*/""",
+                            list_padding='pow2')
+        where = Template("""id IN /*:ids*/(1)""")
+        query, bound_variables = template.render(where=where, ids=[1, 2, 3])
+        assert query == "SELECT * FROM t_member WHERE id IN (?, ?, ?, ?)"
+        assert bound_variables == [1, 2, 3, 3]
+
+    def test_unsupported_padding(self):
+        self.assertRaises(exc.ArgumentError, Template, self.text, list_padding='fibonacci')
+
+class ArrayBindsTest(unittest.TestCase):
+
+    text = """SELECT id FROM t_member WHERE id IN /*:ids*/(1, 2) AND status = /*:status*/1 ORDER BY id"""
+
+    def test_postgresql(self):
+        template = Template(self.text, array_binds='postgresql')
+        query, bound_variables = template.render(ids=(1, 2, 3), status=1)
+        assert query == "SELECT id FROM t_member WHERE id IN (SELECT unnest(?)) AND status = ? ORDER BY id"
+        assert bound_variables == [[1, 2, 3], 1]
+
+        template = Template(self.text, parameter_format='dict', array_binds='postgresql')
+        query, bound_variables = template.render(ids=range(50000), status=1)
+        assert query == "SELECT id FROM t_member WHERE id IN (SELECT unnest(:ids)) AND status = :status ORDER BY id"
+        assert bound_variables == dict(ids=range(50000), status=1)
+
+    def test_sqlite(self):
+        import sqlite3
+        connection = sqlite3.connect(':memory:')
+        connection.execute("CREATE TABLE t_member (id INTEGER, status INTEGER)")
+        connection.executemany("INSERT INTO t_member VALUES (?, ?)", [(i, i % 2) for i in range(10)])
+        for parameter_format in ('list', 'dict'):
+            template = Template(self.text, parameter_format=parameter_format, array_binds='sqlite')
+            query, bound_variables = template.render(ids=[1, 2, 3, 4, 5], status=1)
+            assert "id IN (SELECT value FROM json_each(" in query
+            assert connection.execute(query, bound_variables).fetchall() == [(1,), (3,), (5,)]
+            query, bound_variables = template.render(ids=[], status=1)
+            assert connection.execute(query, bound_variables).fetchall() == []
+
+    def test_sqlite_non_json_values(self):
+        import datetime
+        import decimal
+        import sqlite3
+        connection = sqlite3.connect(':memory:')
+        connection.execute("CREATE TABLE t_event (created TEXT, day TEXT, amount REAL)")
+        connection.execute("INSERT INTO t_event VALUES (?, ?, ?)",
+                           (datetime.datetime(2011, 1, 2, 3, 4, 5), datetime.date(2011, 1, 2), 1.5))
+        template = Template("""SELECT amount FROM t_event WHERE created IN /*:created*/('a')
+            AND day IN /*:days*/('a') AND amount IN /*:amounts*/(1)""", array_binds='sqlite')
+        query, bound_variables = template.render(created=[datetime.datetime(2011, 1, 2, 3, 4, 5)],
+                                                 days=[datetime.date(2011, 1, 2)],
+                                                 amounts=[decimal.Decimal('1.5')])
+        assert connection.execute(query, bound_variables).fetchall() == [(1.5,)]
+        self.assertRaises(exc.RenderError, template.render, created=[object()], days=[], amounts=[])
+
+        # neither survives a round trip through float
+        connection.execute("CREATE TABLE t_account (id INTEGER, balance NUMERIC)")
+        connection.executemany("INSERT INTO t_account VALUES (?, ?)",
+                               [(9007199254740993, '0.1'), (9007199254740992, '0.3')])
+        template = Template("SELECT id FROM t_account WHERE id IN /*:ids*/(1)", array_binds='sqlite')
+        query, bound_variables = template.render(ids=[decimal.Decimal('9007199254740993')])
+        assert connection.execute(query, bound_variables).fetchall() == [(9007199254740993,)]
+        template = Template("SELECT id FROM t_account WHERE balance IN /*:balances*/(1)",
+                            array_binds='sqlite')
+        query, bound_variables = template.render(balances=[decimal.Decimal('0.1')])
+        assert connection.execute(query, bound_variables).fetchall() == [(9007199254740993,)]
+
+    def test_in_for_loop(self):
+        template = Template("""SELECT * FROM t_member WHERE FALSE
+            /*#for group in groups*/OR group_id IN /*:group*/(1, 2)/*#/for*/""",
+            parameter_format='dict', array_binds='postgresql')
+        query, bound_variables = template.render(groups=[[1, 2], [3]])
+        assert "OR group_id IN (SELECT unnest(:group_1))" in query
+        assert "OR group_id IN (SELECT unnest(:group_2))" in query
+        assert bound_variables == dict(group_1=[1, 2], group_2=[3])
+
+    def test_unsupported_dialect(self):
+        self.assertRaises(exc.ArgumentError, Template, self.text, array_binds='oracle')
+
+class AttributeAccessTest(unittest.TestCase):
+
+    class Member(object):
+
+        def __init__(self, **kw):
+            self.__dict__.update(kw)
+
+    def test_substitute_attribute(self):
+        template = Template("""SELECT * FROM t_member WHERE name = /*:member.name*/'kjim'""")
+        query, bound_variables = template.render(member=self.Member(name='keiji'))
+        assert query == "SELECT * FROM t_member WHERE name = ?"
+        assert bound_variables == ['keiji']
+
+    def test_dotted_controls(self):
+        template = Template("""SELECT * FROM t_member WHERE FALSE
+            /*#if filter.enabled*/OR status IN /*:filter.status*/(1)/*#/if*/
+            /*#for id in filter.ids*/OR id = /*:id*/1/*#/for*/""")
+        query, bound_variables = template.render(
+            filter=self.Member(enabled=True, status=[1, 2], ids=[3, 4]))
+        assert "OR status IN (?, ?)" in query
+        assert query.count("OR id = ?") == 2
+        assert bound_variables == [1, 2, 3, 4]
+
+    def test_missing_attribute(self):
+        template = Template("""SELECT * FROM t_member WHERE name = /*:member.name*/'kjim'""")
+        self.assertRaises(exc.RenderError, template.render, member=self.Member())
+
 class ForAnyCaseTest(unittest.TestCase):
 
     def test_usage_for(self):
@@ -306,6 +648,136 @@ class ForAnyCaseTest(unittest.TestCase):
             'item__dot__firstname_2': 'x60', 'item__dot__lastname_2': 'thinkpad',
         }
 
+class FromFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.threshold = template_module.MMAP_THRESHOLD
+
+    def tearDown(self):
+        template_module.MMAP_THRESHOLD = self.threshold
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        f = open(path, 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+        return path
+
+    def each_loading(self):
+        """run the test reading files at once, then memory-mapping them."""
+        for threshold in (self.threshold, 1):
+            template_module.MMAP_THRESHOLD = threshold
+            yield threshold
+
+    def test_from_file(self):
+        path = self.write('member.sql', "SELECT * FROM t_member WHERE id = /*:id*/1")
+        for i in self.each_loading():
+            template = Template.from_file(path, parameter_format='dict')
+            assert template.filename == path
+            assert template.uri == path
+            assert template.render(id=1) == ("SELECT * FROM t_member WHERE id = :id", {'id': 1})
+
+    def test_encodings(self):
+        name = u'\u3042'
+        bom = self.write('bom.sql', codecs.BOM_UTF8 + (u"SELECT '%s'" % name).encode('utf-8'))
+        magic = self.write('magic.sql', (u"# coding: euc-jp\nSELECT '%s'" % name).encode('euc-jp'))
+        given = self.write('given.sql', (u"SELECT '%s'" % name).encode('shift_jis'))
+        for i in self.each_loading():
+            assert Template.from_file(bom).render() == (u"SELECT '%s'" % name, [])
+            assert Template.from_file(magic).render() == (u"SELECT '%s'" % name, [])
+            assert Template.from_file(given, input_encoding='shift_jis').render() == (u"SELECT '%s'" % name, [])
+            self.assertRaises(exc.CompileError, Template.from_file, given)
+
+    def test_errors_name_file(self):
+        conflict = self.write('conflict.sql', codecs.BOM_UTF8 + "# coding: latin-1\nSELECT 1")
+        broken = self.write('broken.sql', "SELECT /*#if a*/1")
+        for i in self.each_loading():
+            for path in (conflict, broken):
+                try:
+                    Template.from_file(path)
+                except (exc.CompileError, exc.SyntaxError), e:
+                    assert e.filename == path
+                else:
+                    self.fail()
+
+class LazyTest(unittest.TestCase):
+
+    def test_compiled_on_first_render(self):
+        template = Template("SELECT * FROM t_member WHERE id = /*:id*/1", lazy=True)
+        assert 'node' not in template.__dict__
+        assert template.render(id=1) == ("SELECT * FROM t_member WHERE id = ?", [1])
+        assert 'node' in template.__dict__
+
+    def test_errors_raised_when_compiled(self):
+        template = Template("SELECT /*#if a*/1", lazy=True)
+        self.assertRaises(exc.SyntaxError, template.render, a=True)
+        self.assertRaises(exc.SyntaxError, Template, "SELECT /*#if a*/1")
+
+    def test_compile_and_warm(self):
+        template = Template("SELECT /*:a*/1", lazy=True)
+        assert template.compile() is template
+        node = template.node
+        assert template.compile().node is node
+        templates = dict(a=Template("SELECT 1", lazy=True), b=Template("SELECT 2", lazy=True), c='SELECT 3')
+        warm(templates.values())
+        assert 'node' in templates['a'].__dict__ and 'node' in templates['b'].__dict__
+
+    def test_embedded_lazy_template(self):
+        condition = Template("status = /*:status*/1", lazy=True)
+        template = Template("SELECT 1 WHERE /*#embed condition*/TRUE/*#/embed*/", lazy=True)
+        assert template.render(condition=condition, status=2) == ("SELECT 1 WHERE status = ?", [2])
+
+    def test_threads(self):
+        import threading
+        template = Template("SELECT /*#for i in items*//*:i*/1, /*#/for*/0", lazy=True)
+        (nodes, results) = ([], [])
+        def render():
+            results.append(template.render(items=[1, 2]))
+            nodes.append(template.node)
+        threads = [threading.Thread(target=render) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == [("SELECT ?, ?, 0", [1, 2])] * 8
+        assert len(set(map(id, nodes))) == 1
+
+class ReadOnlyContextTest(unittest.TestCase):
+
+    query = "SELECT 1 /*#for item in items*/, /*:item*/0 /*#if item*//*:flag*/0/*#endif*//*#endfor*/"
+
+    def test_context_left_unchanged(self):
+        for strict in (True, False):
+            for fmt in ('list', 'dict', 'pyformat'):
+                template = Template(self.query, strict=strict, parameter_format=fmt)
+                context = dict(items=[0, 1], flag=True)
+                template.render_many([context])
+                list(template.render_many([context]))
+                template.render_executemany([context])
+                list(template.render_chunks(max_params=2, **context))
+                assert context == dict(items=[0, 1], flag=True)
+
+    def test_shared_context_across_threads(self):
+        import threading
+        template = Template(self.query)
+        base = dict(items=range(50), flag=True)
+        expected = template.render(**base)
+        results = []
+        def render():
+            for (query, params) in template.render_many([base] * 20):
+                results.append((query, params) == expected)
+        threads = [threading.Thread(target=render) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == [True] * 80
+        assert sorted(base) == ['flag', 'items']
+
 class UseCase_DynamicAppendableColumn(unittest.TestCase):
 
     query = """
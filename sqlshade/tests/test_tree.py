@@ -77,3 +77,41 @@ class CommentTest(unittest.TestCase):
         line_comment = wrap_node(tree.Comment)('this is a line comment', False)
         assert line_comment.text == 'this is a line comment'
         assert line_comment.is_block == False
+
+class CompactNodeTest(unittest.TestCase):
+
+    def test_no_instance_dict(self):
+        nodes = [
+            wrap_node(tree.Literal)('SELECT 1'),
+            wrap_node(tree.Comment)('comment', True),
+            wrap_node(tree.SubstituteComment)('item', '1'),
+            wrap_node(tree.ControlComment)('for', 'item in items'),
+            wrap_node(tree.ControlComment)('if', 'item'),
+            wrap_node(tree.ControlComment)('embed', 'item'),
+            wrap_node(tree.ControlComment)('tip', ''),
+        ]
+        for node in nodes:
+            assert not hasattr(node, '__dict__'), node
+
+    def test_source_and_filename_held_by_template(self):
+        template = tree.TemplateNode('member.sql', 'SELECT /*:id*/1')
+        literal = tree.Literal('SELECT ', template=template, lineno=1, pos=1)
+        substitute = tree.SubstituteComment('id', '1', template=template, lineno=1, pos=8)
+        for_comment = tree.ControlComment('for', 'item in items', template=template, lineno=1, pos=8)
+        assert type(for_comment) == tree.For
+        for node in (literal, substitute, for_comment):
+            assert node.template is template
+            assert node.source == 'SELECT /*:id*/1'
+            assert node.filename == 'member.sql'
+        assert substitute.exception_kwargs == {'source': 'SELECT /*:id*/1', 'lineno': 1, 'pos': 8, 'filename': 'member.sql'}
+
+    def test_source_and_filename_without_template(self):
+        node = wrap_node(tree.Literal, source='SELECT 1', filename='member.sql')('SELECT 1')
+        assert node.source == 'SELECT 1'
+        assert node.filename == 'member.sql'
+        try:
+            wrap_node(tree.ControlComment, filename='member.sql')('undefined', 'arg')
+        except exc.CompileError, e:
+            assert e.filename == 'member.sql'
+        else:
+            assert False
@@ -3,16 +3,35 @@
 """defines the parse tree components for sqlshade templates."""
 
 from sqlshade import util, exc
+from sqlshade.resolver import Resolver
 
 import re
 
 class Node(object):
-    """base class for a Node in the parse tree."""
-    def __init__(self, source, lineno, pos, filename):
-        self.source = source
+    """base class for a Node in the parse tree.
+
+    the source text and filename are held once by the TemplateNode the node
+    belongs to.  a node built without one, given its source and filename
+    directly, gets a TemplateNode of its own to hold them.
+
+    """
+
+    __slots__ = ('template', 'lineno', 'pos')
+
+    def __init__(self, source=None, lineno=0, pos=0, filename=None, template=None):
+        if template is None:
+            template = TemplateNode(filename, source)
+        self.template = template
         self.lineno = lineno
         self.pos = pos
-        self.filename = filename
+
+    @property
+    def source(self):
+        return self.template.source
+
+    @property
+    def filename(self):
+        return self.template.filename
 
     @property
     def exception_kwargs(self):
@@ -22,17 +41,22 @@ class Node(object):
         return []
 
     def accept_visitor(self, visitor, context):
-        def traverse(node, context):
-            for n in node.get_children():
+        method = getattr(visitor, "visit" + self.__class__.__name__ + '_' + context.mode, None)
+        if method is None:
+            for n in self.get_children():
                 n.accept_visitor(visitor, context)
-        method = getattr(visitor, "visit" + self.__class__.__name__ + '_' + context.mode, traverse)
-        method(self, context)
+        else:
+            method(self, context)
 
 class TemplateNode(Node):
     """a 'container' node that stores the overall collection of nodes."""
 
-    def __init__(self, filename):
-        super(TemplateNode, self).__init__('', 0, 0, filename)
+    __slots__ = ('source', 'filename', 'nodes', 'page_attributes', '__weakref__')
+
+    def __init__(self, filename, source=''):
+        super(TemplateNode, self).__init__(lineno=0, pos=0, template=self)
+        self.source = source
+        self.filename = filename
         self.nodes = []
         self.page_attributes = {}
 
@@ -45,6 +69,8 @@ class TemplateNode(Node):
 class Literal(Node):
     """defines literal in the template."""
 
+    __slots__ = ('text',)
+
     def __init__(self, text, **kwargs):
         super(Literal, self).__init__(**kwargs)
         self.text = text
@@ -61,6 +87,8 @@ class Comment(Node):
     
     """
 
+    __slots__ = ('text', 'is_block')
+
     def __init__(self, text, is_block, **kwargs):
         super(Comment, self).__init__(**kwargs)
         self.text = text
@@ -78,10 +106,13 @@ class SubstituteComment(Node):
 
     """
 
+    __slots__ = ('ident', 'text', 'resolver')
+
     def __init__(self, ident, text, **kwargs):
         super(SubstituteComment, self).__init__(**kwargs)
         self.ident = ident
         self.text = text
+        self.resolver = Resolver(ident)
 
     def __repr__(self):
         return "SubstituteComment(%r, %r)" % ((self.ident, self.text), (self.lineno, self.pos))
@@ -100,11 +131,14 @@ class _ControlCommentMeta(type):
         try:
             cls = _ControlCommentMeta._classmap[keyword]
         except KeyError:
+            template = kwargs.get('template')
+            if template is None:
+                template = TemplateNode(kwargs.get('filename'), kwargs.get('source'))
             raise exc.CompileError("No such Control: '%s'" % keyword,
-                source=kwargs['source'],
-                lineno=kwargs['lineno'],
-                pos=kwargs['pos'],
-                filename=kwargs['filename']
+                source=template.source,
+                lineno=kwargs.get('lineno', 0),
+                pos=kwargs.get('pos', 0),
+                filename=template.filename
             )
         return type.__call__(cls, keyword, text, **kwargs)
 
@@ -119,6 +153,7 @@ class ControlComment(Node):
 
     __metaclass__ = _ControlCommentMeta
     __keyword__ = None
+    __slots__ = ('keyword', 'text', 'parent', 'nodes')
 
     def __init__(self, keyword, text, **kwargs):
         """construct a new Tag instance.
@@ -129,7 +164,7 @@ class ControlComment(Node):
 
         text - the control argument text
         
-        **kwargs - other arguments passed to the Node superclass (lineno, pos)
+        **kwargs - other arguments passed to the Node superclass (template, lineno, pos)
         
         """
         super(ControlComment, self).__init__(**kwargs)
@@ -154,6 +189,7 @@ class ControlComment(Node):
 
 class For(ControlComment):
     __keyword__ = 'for'
+    __slots__ = ('item', 'ident', 'resolver')
 
     for_pattern = r"""^\s* (\w+) \s+ in \s+ ([\w.]+) \s*$"""
     for_reg = re.compile(for_pattern, re.X)
@@ -164,9 +200,11 @@ class For(ControlComment):
         if match is None:
             raise exc.SyntaxError("for syntax is 'for <item> in <ident>'", **self.exception_kwargs)
         (self.item, self.ident) = (match.group(1), match.group(2))
+        self.resolver = Resolver(self.ident)
 
 class If(ControlComment):
     __keyword__ = 'if'
+    __slots__ = ('ident', 'resolver')
 
     if_pattern = r"""^\s* ([\w.]+) \s*$"""
     if_reg = re.compile(if_pattern, re.X)
@@ -177,9 +215,11 @@ class If(ControlComment):
         if match is None:
             raise exc.SyntaxError("if syntax is 'if <ident>'", **self.exception_kwargs)
         self.ident = match.group(1)
+        self.resolver = Resolver(self.ident)
 
 class Embed(ControlComment):
     __keyword__ = 'embed'
+    __slots__ = ('ident', 'resolver')
 
     embed_pattern = r"""^\s* ([\w.]+) \s*$"""
     embed_reg = re.compile(embed_pattern, re.X)
@@ -190,9 +230,34 @@ class Embed(ControlComment):
         if match is None:
             raise exc.SyntaxError("embed syntax is 'embed <ident>'", **self.exception_kwargs)
         self.ident = match.group(1)
+        self.resolver = Resolver(self.ident)
+
+class Include(ControlComment):
+    """includes another template of the lookup, in place of the text
+    between the controls.
+
+    /*#include fragments/active_member.sql*/TRUE/*#/include*/
+
+    the included tree is spliced into the template when it is compiled.
+
+    """
+
+    __keyword__ = 'include'
+    __slots__ = ('name',)
+
+    include_pattern = r"""^\s* ([\w./-]+) \s*$"""
+    include_reg = re.compile(include_pattern, re.X)
+
+    def __init__(self, keyword, text, **kwargs):
+        super(Include, self).__init__(keyword, text, **kwargs)
+        match = self.include_reg.match(text)
+        if match is None:
+            raise exc.SyntaxError("include syntax is 'include <uri>'", **self.exception_kwargs)
+        self.name = match.group(1)
 
 class Tip(ControlComment):
     __keyword__ = 'tip'
+    __slots__ = ()
 
     def __init__(self, keyword, text='', **kwargs):
         super(Tip, self).__init__(keyword, '', **kwargs)
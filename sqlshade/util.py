@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import collections
+
 def sorted_dict_repr(d):
     """repr() a dictionary with the keys in order.
     
@@ -29,3 +31,60 @@ class FastEncodingBuffer(object):
             return self.delim.join(self.data).encode(self.encoding, self.errors)
         else:
             return self.delim.join(self.data)
+
+class LRUCache(object):
+    """a mapping holding at most `capacity` items, discarding the least
+    recently used one when full.  a negative capacity means no bound.
+    on_evict, if given, is called with the key and value of each item
+    discarded that way.
+
+    not thread safe on its own; callers sharing one across threads hold a lock.
+
+    """
+
+    def __init__(self, capacity, on_evict=None):
+        self.capacity = capacity
+        self.on_evict = on_evict
+        self._data = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            return default
+        self._data[key] = value
+        return value
+
+    def __getitem__(self, key):
+        value = self._data.pop(key)
+        self._data[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._data.pop(key, None)
+        self._data[key] = value
+        if self.capacity >= 0 and len(self._data) > self.capacity:
+            (key, value) = self._data.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(key, value)
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def pop(self, key, *default):
+        return self._data.pop(key, *default)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def keys(self):
+        return self._data.keys()
+
+    def values(self):
+        return self._data.values()
+
+    def clear(self):
+        self._data.clear()